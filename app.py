@@ -1,9 +1,19 @@
 import streamlit as st
 import craigslistscraper as cs
 import pandas as pd
+import os
 import time
 from datetime import datetime
 from spellchecker import SpellChecker
+from craigslistscraper.filters import VEHICLE_CATEGORIES
+
+# Number of general English words (most frequent first) offered as
+# suggestions. Every word in the dictionary is still treated as correct.
+SUGGESTER_ENGLISH_WORDS = 30000
+
+# Parsed results are cached on local disk and shared by every server process.
+RESULT_CACHE_PATH = os.environ.get("CLSCRAPER_CACHE_PATH", ".cache/results.sqlite")
+RESULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
 
 
 # Configure page
@@ -99,7 +109,13 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-@st.cache_data(ttl=300)
+@st.cache_resource
+def load_result_cache() -> cs.ResultCache:
+    """Opens the on-disk result cache shared by all Streamlit replicas."""
+    return cs.ResultCache(RESULT_CACHE_PATH, max_bytes=RESULT_CACHE_MAX_BYTES)
+
+
+
 def perform_craigslist_search(
     query: str,
     location: str,
@@ -108,6 +124,15 @@ def perform_craigslist_search(
     filters: dict | None = None
 ) -> tuple[list, int, str | None]:
     """Performs a Craigslist search and returns ads, status, and error."""
+    cache = load_result_cache()
+    key = cache.make_key(
+        "search", query=query, location=location, category=category,
+        sort_by=sort_by, filters=filters or {}
+    )
+    cached = cache.get(key)
+    if cached is not None:
+        return [cs.Ad.from_dict(ad) for ad in cached], 200, None
+
     try:
         search_params = {"query": query, "category": category}
         if len(location) == 2:
@@ -116,9 +141,14 @@ def perform_craigslist_search(
             search_params["city"] = location
 
         search_result = cs.Search(**search_params)
-        status_code = search_result.fetch(sort_by=sort_by, params=filters)
+        search_filters = cs.SearchFilters(**filters) if filters else None
+        status_code = search_result.fetch(sort_by=sort_by, filters=search_filters)
 
         if status_code == 200:
+            cache.set(key, [ad.to_dict() for ad in search_result.ads], ttl=300)
+            if category in VEHICLE_CATEGORIES:
+                # Teach the suggester makes and models from fresh results.
+                load_query_suggester().add_titles(ad.title for ad in search_result.ads)
             return search_result.ads, status_code, None
         else:
             return [], status_code, f"Search failed with status code: {status_code}"
@@ -129,14 +159,21 @@ def perform_craigslist_search(
 
 
 
-@st.cache_data(ttl=600)
 def fetch_ad_details(ad_url: str) -> tuple[dict | None, int, str]:
     """Fetches and caches ad details, handling errors gracefully."""
+    cache = load_result_cache()
+    key = cache.make_key("ad", url=ad_url)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached, 200, None
+
     try:
         ad = cs.Ad(url=ad_url)
         status_code = ad.fetch()
         if status_code == 200:
-            return ad.to_dict(), status_code, None
+            details = ad.to_dict()
+            cache.set(key, details, ttl=600)
+            return details, status_code, None
         else:
             return None, status_code, f"Failed to fetch ad details: Status code {status_code}"
     except Exception as e:
@@ -144,6 +181,20 @@ def fetch_ad_details(ad_url: str) -> tuple[dict | None, int, str]:
 
 
 
+@st.cache_resource
+def load_query_suggester() -> cs.QuerySuggester:
+    """Builds the query suggester once per server process. It is seeded with
+    the Craigslist category, area and vehicle vocabulary, then English: the
+    common words as suggestions and the whole dictionary as known words."""
+    suggester = cs.QuerySuggester.from_craigslist()
+    english = SpellChecker().word_frequency.dictionary
+    suggester.add_known(english.keys())
+    for word, count in english.most_common(SUGGESTER_ENGLISH_WORDS):
+        suggester.add_word(word, count)
+    return suggester
+
+
+
 @st.cache_data(ttl=3600)
 def load_all_cities() -> list:
     """Loads and caches all city hostnames from areas.json."""
@@ -220,21 +271,11 @@ def main():
     )
     
     # Spell check the query
+    suggester = load_query_suggester()
     if query:
-        spell = SpellChecker()
-        words = query.split()
-        misspelled = spell.unknown(words)
-        
-        if misspelled:
-            corrected_words = []
-            for word in words:
-                correction = spell.correction(word)
-                corrected_words.append(correction if correction is not None else word)
-
-            corrected_query = " ".join(corrected_words)
-            
-            if corrected_query.lower() != query.lower():
-                st.sidebar.info(f"Did you mean: **{corrected_query}**?")
+        corrected_query = suggester.correct(query)
+        if corrected_query.lower() != query.lower():
+            st.sidebar.info(f"Did you mean: **{corrected_query}**?")
 
     # Location selection
     all_cities = load_all_cities()
@@ -353,12 +394,15 @@ def main():
         filters = {
             "max_price": max_price if max_price > 0 else None,
             "min_price": min_price if min_price > 0 else None,
-            "postedToday": 1 if posted_today else None,
-            "hasPic": 1 if has_image else None,
-            "bundleDuplicates": 1 if bundle_duplicates else None,
+            "posted_today": posted_today or None,
+            "has_pic": has_image or None,
+            "bundle_duplicates": bundle_duplicates or None,
         }
         filters = {k: v for k, v in filters.items() if v is not None}
 
+        if query:
+            suggester.add_query(query)
+
         search_description = f"'{query}'" if query else "all listings"
         with st.spinner(f"🔍 Searching for {search_description} in {location.title()}..."):
             start_time = time.time()
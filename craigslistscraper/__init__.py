@@ -5,8 +5,45 @@ from .ad import fetch_ad
 from .search import Search
 from .search import SearchParser
 from .search import fetch_search 
+from .search import SearchBackend
+from .search import HTMLSearchBackend
+
+from .jsonapi import JSONSearchBackend
+from .jsonapi import SearchJSONParser
+
+from .filters import SearchFilters
+
+from .extract import AttributeExtractor
+from .extract import extract_attributes
+
+from .crawl import WorkQueue
+from .crawl import SQLiteWorkQueue
+from .crawl import CrawlCoordinator
+from .crawl import Worker
+
+from .scheduler import RefreshScheduler
+
+from .merge import TopKMerge
+from .merge import top_k
+
+from .delta import DeltaFetcher
+from .delta import FingerprintStore
+
+from .cache import ResultCache
+
+from .suggest import QuerySuggester
+
+from .archive import Archive
+from .archive import reparse
 
 from .utils import get_us_cities
+from .utils import get_sub_areas
+
+from .metrics import Metrics
+from .metrics import metrics
+
+from .singleflight import SingleFlight
+from .singleflight import flight
 
 __version__ = "1.1.2"
 
@@ -1,10 +1,18 @@
 from bs4 import BeautifulSoup, Tag
+from html.parser import HTMLParser
 import requests
+import codecs
+import copy
 import re
-from typing import Optional, Union, List, Dict
+from typing import TYPE_CHECKING, Optional, Union, List, Dict, Tuple
 
+from .metrics import metrics
+from .singleflight import archive_key, flight, request_key
 from .utils import format_price
 
+if TYPE_CHECKING:
+    from .archive import Archive
+
 
 class Ad:
     def __init__(
@@ -16,12 +24,16 @@ class Ad:
         description: Optional[str] = None,
         attributes: Optional[Dict] = None,
         image_urls: Optional[List[str]] = None,
+        tags: Optional[List[str]] = None,
     ) -> None:
         """An abstraction for a Craigslist 'Ad'. At the bare minimum you need a
         url to define an ad. Although, at search-time, information such as the
         price, title, and d_pid can additionally be computed. If not provided,
         these are computed lazily if the user fetches the ad information with
         `ad.fetch()`.
+
+        `tags` holds the ad page's attribute texts that are not "key: value"
+        pairs, such as "2BR / 1Ba", "850ft2" or "2008 bmw 328i".
         """
         self.url = url
         self.price = price
@@ -30,26 +42,108 @@ class Ad:
         self.description = description
         self.attributes = attributes
         self.image_urls = image_urls
+        self.tags = tags
+        self.bytes_read: Optional[int] = None
+        self.bytes_saved: Optional[int] = None
 
     def __repr__(self) -> str:
         if self.title is None or self.price is None:
             return f"< {self.url} >"
         return f"< {self.title} (${self.price}): {self.url} >"
 
-    def fetch(self, **kwargs) -> int:
-        """Fetch additional data from the url of the ad."""
-        self.request = requests.get(self.url, **kwargs)
-        if self.request.status_code == 200:
-            parser = AdParser(self.request.content)
-            self.price = parser.price
-            self.title = parser.title
-            self.d_pid = parser.d_pid
-            self.description = parser.description
-            self.attributes = parser.attributes
-            self.image_urls = parser.image_urls
-            #self.metadata = parser.metadata  # Commented out as metadata is not used
-
-        return self.request.status_code
+    def fetch(
+        self,
+        stream: bool = False,
+        chunk_size: int = 8192,
+        archive: Optional["Archive"] = None,
+        **kwargs
+    ) -> int:
+        """Fetch additional data from the url of the ad.
+
+        With `stream=True` the body is read in chunks of `chunk_size` bytes and
+        the connection is closed as soon as every section the `AdParser` needs
+        has been seen. The number of bytes read and, when the server sent a
+        Content-Length, the number of bytes skipped are stored on the ad as
+        `bytes_read` and `bytes_saved` and added to `metrics`. Chunked
+        responses have no length to compare against, so their `bytes_saved`
+        is None and they are counted in the "ad_bytes_saved_unknown" metric
+        instead.
+
+        If an `archive` is given, the downloaded body (only the part that was
+        read, when streaming) is appended to it.
+
+        Concurrent fetches of the same url, params and archive, from any
+        thread, share a single request and parse (see `singleflight.flight`).
+        """
+        key = request_key("ad", self.url, stream=stream, archive=archive_key(archive), **kwargs)
+        result, _ = flight.do(key, lambda: self._download(stream, chunk_size, archive, **kwargs))
+        return self._apply(*result)
+
+    async def fetch_async(
+        self,
+        stream: bool = False,
+        chunk_size: int = 8192,
+        archive: Optional["Archive"] = None,
+        **kwargs
+    ) -> int:
+        """The same as `fetch()`, awaitable from asyncio. Concurrent tasks and
+        threads fetching the same url share a single request."""
+        key = request_key("ad", self.url, stream=stream, archive=archive_key(archive), **kwargs)
+        result, _ = await flight.do_async(
+            key, lambda: self._download(stream, chunk_size, archive, **kwargs)
+        )
+        return self._apply(*result)
+
+    def _download(
+        self,
+        stream: bool,
+        chunk_size: int,
+        archive: Optional["Archive"],
+        **kwargs
+    ) -> Tuple[requests.Response, Dict]:
+        """Requests and parses the ad, returning the response and the parsed
+        fields."""
+        if not stream:
+            response = requests.get(self.url, **kwargs)
+            if response.status_code != 200:
+                return response, {}
+            content = response.content
+            fields = _parsed_fields(AdParser(content))
+        else:
+            response = requests.get(self.url, stream=True, **kwargs)
+            if response.status_code != 200:
+                response.close()
+                return response, {}
+            content, bytes_read, bytes_saved = _read_stream(response, chunk_size)
+            fields = _parsed_fields(AdParser(content))
+            fields["bytes_read"] = bytes_read
+            fields["bytes_saved"] = bytes_saved
+
+        if archive is not None:
+            archive.append(self.url, content, kind="ad", d_pid=fields["d_pid"])
+        return response, fields
+
+    def _apply(self, response: requests.Response, fields: Dict) -> int:
+        self.request = response
+        if response.status_code == 200:
+            # The fields may be shared with coalesced fetches of the same url.
+            for name, value in copy.deepcopy(fields).items():
+                setattr(self, name, value)
+        return response.status_code
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Ad":
+        """The inverse of `to_dict()`."""
+        return cls(
+            url=data["url"],
+            price=data.get("price"),
+            title=data.get("title"),
+            d_pid=data.get("d_pid"),
+            description=data.get("description"),
+            attributes=data.get("attributes"),
+            image_urls=data.get("image_urls"),
+            tags=data.get("tags"),
+        )
 
     def to_dict(self) -> Dict:
         return {
@@ -60,6 +154,7 @@ class Ad:
             "description": self.description,
             "image_urls": self.image_urls,
             "attributes": self.attributes,
+            "tags": self.tags,
         }
 
 
@@ -70,6 +165,103 @@ def fetch_ad(url: str, **kwargs) -> Ad:
     return ad
 
 
+def _parsed_fields(parser: "AdParser") -> Dict:
+    return {
+        "price": parser.price,
+        "title": parser.title,
+        "d_pid": parser.d_pid,
+        "description": parser.description,
+        "attributes": parser.attributes,
+        "image_urls": parser.image_urls,
+        "tags": parser.tags,
+        #"metadata": parser.metadata,  # Commented out as metadata is not used
+    }
+
+
+def _read_stream(
+    response: requests.Response,
+    chunk_size: int,
+) -> Tuple[bytes, int, Optional[int]]:
+    """Reads `response` until the `AdParser` sections have all been seen and
+    returns the content, the bytes read and the bytes saved (if known)."""
+    scanner = _AdSectionScanner()
+    decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+    chunks: List[bytes] = []
+    try:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            chunks.append(chunk)
+            scanner.feed(decoder.decode(chunk))
+            if scanner.done:
+                break
+        wire_bytes = _wire_bytes_read(response)
+    finally:
+        response.close()
+
+    content = b"".join(chunks)
+    bytes_read = wire_bytes if wire_bytes is not None else len(content)
+    bytes_saved = None
+    content_length = response.headers.get("Content-Length")
+    if content_length and content_length.isdigit():
+        bytes_saved = max(int(content_length) - bytes_read, 0)
+
+    metrics.incr("ad_stream_fetches")
+    metrics.incr("ad_bytes_read", bytes_read)
+    if bytes_saved is not None:
+        metrics.incr("ad_bytes_saved", bytes_saved)
+    else:
+        metrics.incr("ad_bytes_saved_unknown")
+    if scanner.done:
+        metrics.incr("ad_stream_early_stops")
+    return content, bytes_read, bytes_saved
+
+
+def _wire_bytes_read(response: requests.Response) -> Optional[int]:
+    """Bytes pulled off the socket so far, which is what Content-Length counts
+    (before any gzip decoding)."""
+    tell = getattr(response.raw, "tell", None)
+    try:
+        return int(tell()) if tell else None
+    except (TypeError, ValueError, OSError):
+        return None
+
+
+class _AdSectionScanner(HTMLParser):
+    """Incrementally scans an ad page and flags `done` once the sections the
+    `AdParser` reads have all gone by: the `og:url` meta tag, the title, and
+    the closing tag of `#postingbody`. The price, `.attrgroup` blocks and the
+    thumbnails all precede the posting body on Craigslist ad pages.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=False)
+        self.seen_url = False
+        self.seen_title = False
+        self.body_closed = False
+        self._body_depth = 0
+
+    @property
+    def done(self) -> bool:
+        return self.seen_url and self.seen_title and self.body_closed
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        attributes = dict(attrs)
+        if tag == "meta" and attributes.get("property") == "og:url":
+            self.seen_url = True
+        elif tag == "span" and attributes.get("id") == "titletextonly":
+            self.seen_title = True
+        elif tag == "section":
+            if self._body_depth:
+                self._body_depth += 1
+            elif attributes.get("id") == "postingbody":
+                self._body_depth = 1
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag == "section" and self._body_depth:
+            self._body_depth -= 1
+            if self._body_depth == 0:
+                self.body_closed = True
+
+
 class AdParser:
     def __init__(self, content: Union[str, bytes], **kwargs) -> None:
         self.soup = BeautifulSoup(content, "html.parser", **kwargs)
@@ -121,6 +313,24 @@ class AdParser:
                     attrs[kv[0]] = kv[1]
         return attrs
 
+    @property
+    def tags(self) -> List[str]:
+        """The attribute texts without a "key: value" form, plus the housing
+        summary next to the title (e.g. "/ 2br - 850ft2 -")."""
+        tags: List[str] = []
+        housing = self.soup.find("span", class_="housing")
+        if housing:
+            tags.append(housing.text.strip())
+        for attr_group in self.soup.find_all("p", class_="attrgroup"):
+            if not isinstance(attr_group, Tag):
+                continue
+
+            for attr in attr_group.find_all("span", recursive=False):
+                text = " ".join(attr.text.split())
+                if text and ": " not in text:
+                    tags.append(text)
+        return tags
+
     @property
     def image_urls(self) -> List[str]:
         image_urls = []
@@ -0,0 +1,322 @@
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, Union
+
+from .ad import Ad, AdParser
+from .jsonapi import SearchJSONParser
+from .search import SearchParser
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+INDEX_FILE = "index.jsonl"
+META_FILE = "archive.json"
+SEGMENT_SUFFIX = ".seg"
+
+# Every record in a segment is a 4-byte little-endian length followed by one
+# independently compressed body, so any record can be read on its own.
+RECORD_HEADER = struct.Struct("<I")
+
+# The default `reparse` parser for each kind of record the fetchers archive.
+PARSERS: Dict[str, Type] = {
+    "ad": AdParser,
+    "search": SearchParser,
+    "search_json": SearchJSONParser,
+}
+
+
+def _compressor(compression: str) -> Callable[[bytes], bytes]:
+    if compression == "zstd":
+        if zstandard is None:
+            raise ImportError(
+                "The zstd archive needs the 'zstandard' package. Install it with "
+                "`pip install zstandard` or use compression='zlib'."
+            )
+        return zstandard.ZstdCompressor(level=3).compress
+    if compression == "zlib":
+        return zlib.compress
+    raise ValueError(f"Unknown archive compression '{compression}'.")
+
+
+def _decompressor(compression: str) -> Callable[[bytes], bytes]:
+    if compression == "zstd":
+        if zstandard is None:
+            raise ImportError("Reading a zstd archive needs the 'zstandard' package.")
+        return zstandard.ZstdDecompressor().decompress
+    if compression == "zlib":
+        return zlib.decompress
+    raise ValueError(f"Unknown archive compression '{compression}'.")
+
+
+class Archive:
+    def __init__(
+        self,
+        directory: str,
+        compression: Optional[str] = None,
+        segment_size: int = 64 * 1024 * 1024,
+    ) -> None:
+        """An append-only archive of raw response bodies.
+
+        Bodies are compressed one by one and appended to segment files of up
+        to `segment_size` bytes in `directory`. Each append also writes a line
+        to `index.jsonl` with the url, d_pid, kind ("ad", "search", ...), fetch
+        time and the position of the record. Segments are memory-mapped for
+        reads. Every writing process gets its own segment files, so several
+        processes can share a directory.
+
+        The codec is recorded in `archive.json` when the archive is created,
+        and an existing archive is always opened with its own. `compression`
+        ("zstd" or "zlib") picks the codec of a new archive and defaults to
+        zstd; naming a different codec than an existing archive's raises a
+        `ValueError`.
+
+        Pass an archive as `archive=` to `Ad.fetch` or `Search.fetch` to record
+        what they download, and use `reparse()` to rebuild parsed output later
+        without touching the network.
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.compression = self._resolve_compression(compression)
+        self.segment_size = segment_size
+        self._compress = _compressor(self.compression)
+        self._decompress = _decompressor(self.compression)
+        self._lock = threading.Lock()
+        self._segment: Optional[str] = None
+        self._segment_file = None
+        self._segment_counter = itertools.count()
+        self._maps: Dict[str, mmap.mmap] = {}
+        # The latest entry per ("url", url) and ("d_pid", d_pid), read
+        # incrementally from the index up to `_index_offset`.
+        self._latest: Dict[Tuple[str, Any], Dict[str, Any]] = {}
+        self._index_offset = 0
+
+    def _resolve_compression(self, compression: Optional[str]) -> str:
+        path = os.path.join(self.directory, META_FILE)
+        if not os.path.exists(path):
+            resolved = compression or "zstd"
+            with open(path, "w") as file:
+                json.dump({"compression": resolved}, file)
+            return resolved
+        with open(path, "r") as file:
+            stored = json.load(file)["compression"]
+        if compression is not None and compression != stored:
+            raise ValueError(
+                f"The archive in '{self.directory}' uses '{stored}' compression, not '{compression}'."
+            )
+        return stored
+
+    def _open_segment(self) -> None:
+        if self._segment_file is not None:
+            self._segment_file.close()
+        name = f"{int(time.time() * 1000)}-{os.getpid()}-{next(self._segment_counter)}{SEGMENT_SUFFIX}"
+        self._segment = name
+        self._segment_file = open(os.path.join(self.directory, name), "ab")
+
+    def append(
+        self,
+        url: str,
+        content: bytes,
+        kind: str,
+        d_pid: Optional[int] = None,
+        fetched_at: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Compresses and appends `content` and returns its index entry."""
+        record = self._compress(content)
+        with self._lock:
+            if self._segment_file is None or self._segment_file.tell() >= self.segment_size:
+                self._open_segment()
+            offset = self._segment_file.tell()
+            self._segment_file.write(RECORD_HEADER.pack(len(record)))
+            self._segment_file.write(record)
+            self._segment_file.flush()
+
+            entry = {
+                "url": url,
+                "d_pid": d_pid,
+                "kind": kind,
+                "fetched_at": time.time() if fetched_at is None else fetched_at,
+                "segment": self._segment,
+                "offset": offset + RECORD_HEADER.size,
+                "length": len(record),
+                "size": len(content),
+            }
+            with open(os.path.join(self.directory, INDEX_FILE), "a") as index:
+                index.write(json.dumps(entry) + "\n")
+        return entry
+
+    def entries(self, kind: Optional[str] = None, latest_only: bool = False) -> List[Dict[str, Any]]:
+        """The index entries, oldest first. With `latest_only` only the most
+        recent fetch of each url is kept."""
+        path = os.path.join(self.directory, INDEX_FILE)
+        if not os.path.exists(path):
+            return []
+        entries = []
+        with open(path, "r") as index:
+            for line in index:
+                if not line.endswith("\n"):
+                    break  # A write still in progress.
+                entry = json.loads(line)
+                if kind is None or entry["kind"] == kind:
+                    entries.append(entry)
+        entries.sort(key=lambda e: e["fetched_at"])
+        if latest_only:
+            entries = list({e["url"]: e for e in entries}.values())
+        return entries
+
+    def _map(self, segment: str, end: int) -> mmap.mmap:
+        mapped = self._maps.get(segment)
+        # Segments still being written to are re-mapped once they have grown.
+        if mapped is None or len(mapped) < end:
+            if mapped is not None:
+                mapped.close()
+            with open(os.path.join(self.directory, segment), "rb") as file:
+                mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = mapped
+        return mapped
+
+    def read(self, entry: Dict[str, Any]) -> bytes:
+        """The raw body for an index entry."""
+        start = entry["offset"]
+        end = start + entry["length"]
+        with self._lock:
+            mapped = self._map(entry["segment"], end)
+            record = mapped[start:end]
+        return self._decompress(record)
+
+    def _refresh_latest(self) -> None:
+        """Reads index lines appended since the last call, by any process."""
+        path = os.path.join(self.directory, INDEX_FILE)
+        if not os.path.exists(path) or os.path.getsize(path) <= self._index_offset:
+            return
+        with open(path, "rb") as index:
+            index.seek(self._index_offset)
+            for line in index:
+                if not line.endswith(b"\n"):
+                    break  # A write still in progress.
+                self._index_offset += len(line)
+                entry = json.loads(line)
+                for key in (("url", entry["url"]), ("d_pid", entry["d_pid"])):
+                    if key[1] is None:
+                        continue
+                    current = self._latest.get(key)
+                    if current is None or entry["fetched_at"] >= current["fetched_at"]:
+                        self._latest[key] = entry
+
+    def get(self, url: Optional[str] = None, d_pid: Optional[int] = None) -> Optional[bytes]:
+        """The most recently archived body for a url or d_pid."""
+        with self._lock:
+            self._refresh_latest()
+            entry = None
+            if url is not None:
+                entry = self._latest.get(("url", url))
+            if entry is None and d_pid is not None:
+                entry = self._latest.get(("d_pid", d_pid))
+        return self.read(entry) if entry is not None else None
+
+    def close(self) -> None:
+        with self._lock:
+            if self._segment_file is not None:
+                self._segment_file.close()
+                self._segment_file = None
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps.clear()
+
+    def __enter__(self) -> "Archive":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _to_plain(value: Any) -> Any:
+    if isinstance(value, Ad):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [_to_plain(v) for v in value]
+    return value
+
+
+def parse_record(parser: Type, content: bytes) -> Dict[str, Any]:
+    """Runs `parser` over `content` and returns every property it defines,
+    so fields added to a parser later show up without extra work."""
+    parsed = parser(content)
+    fields = [
+        name
+        for klass in reversed(parser.__mro__)
+        for name, value in vars(klass).items()
+        if isinstance(value, property)
+    ]
+    return {name: _to_plain(getattr(parsed, name)) for name in dict.fromkeys(fields)}
+
+
+def _reparse_segment(
+    directory: str,
+    compression: str,
+    parser: Type,
+    entries: List[Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    decompress = _decompressor(compression)
+    results = []
+    with open(os.path.join(directory, entries[0]["segment"]), "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for entry in entries:
+                content = decompress(mapped[entry["offset"]:entry["offset"] + entry["length"]])
+                record = {
+                    "url": entry["url"],
+                    "fetched_at": entry["fetched_at"],
+                    **parse_record(parser, content),
+                }
+                results.append(record)
+    return results
+
+
+def reparse(
+    archive: Union[Archive, str],
+    parser: Optional[Type] = None,
+    kind: str = "ad",
+    latest_only: bool = True,
+    max_workers: Optional[int] = None,
+    compression: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Rebuilds structured output from archived bodies, one process per
+    segment and no network access. `parser` defaults to the one for `kind`
+    in `PARSERS`. `archive` may be an `Archive` or its directory, which is
+    opened with the codec it was written with.
+    """
+    if not isinstance(archive, Archive):
+        archive = Archive(archive, compression=compression)
+    if parser is None:
+        if kind not in PARSERS:
+            raise ValueError(
+                f"No default parser for '{kind}' records, use one of {sorted(PARSERS)} or pass a parser."
+            )
+        parser = PARSERS[kind]
+
+    by_segment: Dict[str, List[Dict[str, Any]]] = {}
+    for entry in archive.entries(kind=kind, latest_only=latest_only):
+        by_segment.setdefault(entry["segment"], []).append(entry)
+
+    jobs: List[Tuple] = [
+        (archive.directory, archive.compression, parser, entries)
+        for entries in by_segment.values()
+    ]
+    results: List[Dict[str, Any]] = []
+    if max_workers == 1 or len(jobs) <= 1:
+        for job in jobs:
+            results.extend(_reparse_segment(*job))
+        return results
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for records in executor.map(_reparse_segment, *zip(*jobs)):
+            results.extend(records)
+    return results
@@ -0,0 +1,146 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from .utils import ThreadLocalSQLite
+
+
+class ResultCache:
+    def __init__(
+        self,
+        path: str,
+        ttl: float = 300.0,
+        max_bytes: int = 256 * 1024 * 1024,
+        check_every: int = 64,
+    ) -> None:
+        """A cache of parsed results in a SQLite file on local disk that any
+        number of processes (e.g. Streamlit replicas) can share.
+
+        Values are stored as JSON, so they must be plain dicts, lists and
+        scalars; use `Ad.to_dict()` and `Ad.from_dict()` for ads. Entries
+        expire `ttl` seconds after they are set. When the stored values
+        exceed `max_bytes`, expired entries and then the least recently read
+        ones are evicted.
+
+        Reads stay read-only: an entry's last-read time is only updated once
+        it is more than a tenth of `ttl` old, so LRU order is approximate.
+        The total size is checked every `check_every` writes, or sooner when
+        the bytes written since the last check would reach a tenth of
+        `max_bytes`.
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.check_every = check_every
+        self._writes = 0
+        self._bytes_written = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # Let reads come straight from the OS page cache.
+        self._db = ThreadLocalSQLite(path, mmap_size=self.max_bytes * 2)
+        conn = self._connect()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return self._db.connect()
+
+    @staticmethod
+    def make_key(namespace: str, **parts: Any) -> str:
+        """A stable key for `namespace` and keyword parts, e.g.
+        `make_key("search", query="bmw", location="sfbay", filters={...})`."""
+        return namespace + ":" + json.dumps(parts, sort_keys=True, default=str)
+
+    def get(self, key: str) -> Optional[Any]:
+        """The cached value, or None if it is missing or expired."""
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT value, accessed_at FROM results WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        value, accessed_at = row
+        if now - accessed_at > self.ttl * 0.1:
+            conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        data = json.dumps(value)
+        ttl = self.ttl if ttl is None else ttl
+        self._connect().execute(
+            "INSERT OR REPLACE INTO results (key, value, size, expires_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, data, len(data), now + ttl, now),
+        )
+        with self._lock:
+            self._writes += 1
+            self._bytes_written += len(data)
+            check = (
+                self._writes >= self.check_every
+                or self._bytes_written >= self.max_bytes * 0.1
+            )
+            if check:
+                self._writes = self._bytes_written = 0
+        if check and self.size() > self.max_bytes:
+            self.evict()
+
+    def get_or_set(self, key: str, compute: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """Returns the cached value for `key`, computing and storing it on a
+        miss. A None result is not cached."""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            if value is not None:
+                self.set(key, value, ttl)
+        return value
+
+    def delete(self, key: str) -> None:
+        self._connect().execute("DELETE FROM results WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        self._connect().execute("DELETE FROM results")
+
+    def size(self) -> int:
+        """Total size of the stored values in bytes."""
+        row = self._connect().execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()
+        return row[0]
+
+    def evict(self) -> None:
+        """Drops expired entries, then the least recently read entries until
+        the cache is at 90% of `max_bytes`."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            target = int(self.max_bytes * 0.9)
+            if total > target:
+                victims = []
+                for key, size in conn.execute(
+                    "SELECT key, size FROM results ORDER BY accessed_at"
+                ):
+                    if total <= target:
+                        break
+                    victims.append((key,))
+                    total -= size
+                conn.executemany("DELETE FROM results WHERE key = ?", victims)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
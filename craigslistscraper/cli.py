@@ -0,0 +1,356 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from .crawl import CrawlCoordinator, SQLiteWorkQueue, Worker
+from .delta import DeltaFetcher, FingerprintStore
+from .filters import SearchFilters
+from .jsonapi import JSONSearchBackend
+from .search import Search, SearchBackend
+from .utils import get_areas
+
+CSV_FIELDS = [
+    "query",
+    "city",
+    "category",
+    "url",
+    "title",
+    "price",
+    "d_pid",
+    "description",
+    "attributes",
+    "image_urls",
+    "tags",
+]
+
+
+def load_jobs(path: str) -> List[Dict[str, Any]]:
+    """Reads a job file with one JSON object per line. Blank lines and lines
+    starting with "#" are skipped."""
+    jobs = []
+    with open(path, "r") as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                jobs.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{number}: invalid job: {e}") from e
+    return jobs
+
+
+def region_hostnames(region: str) -> List[str]:
+    return sorted({
+        area["Hostname"]
+        for area in get_areas()
+        if (area.get("Region") or "").lower() == region.lower()
+    })
+
+
+def expand_job(job: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Splits a job into units of one (query, city, category) each.
+
+    A job has a "query" and any of "city"/"cities"/"region" (a state or
+    province code) and "category"/"categories" (default "sss"), plus
+    optional "filters" (`SearchFilters` arguments), "sort_by",
+    "fetch_ads" and "shard" (search each metro by sub-area, see
+    `Search.fetch_sharded`).
+    """
+    if "query" not in job:
+        raise ValueError(f"Job is missing a 'query': {job}")
+    cities = list(job.get("cities") or [])
+    if job.get("city"):
+        cities.append(job["city"])
+    if job.get("region"):
+        cities.extend(region_hostnames(job["region"]))
+    if not cities:
+        raise ValueError(f"Job has no 'city', 'cities' or 'region': {job}")
+    categories = list(job.get("categories") or [job.get("category", "sss")])
+
+    # Validate filters up front rather than failing every unit.
+    filters = job.get("filters") or {}
+    SearchFilters(**filters)
+
+    units = [
+        {
+            "query": job["query"],
+            "city": city,
+            "category": category,
+            "filters": filters,
+            "sort_by": job.get("sort_by"),
+            "fetch_ads": bool(job.get("fetch_ads", False)),
+        }
+        for city in dict.fromkeys(cities)
+        for category in categories
+    ]
+    # Only set when asked for, so existing state files keep matching.
+    if job.get("shard"):
+        for unit in units:
+            unit["shard"] = True
+    return units
+
+
+def unit_key(unit: Dict[str, Any]) -> str:
+    return json.dumps(unit, sort_keys=True)
+
+
+class Checkpoint:
+    def __init__(self, path: str) -> None:
+        """The set of finished units, kept in an append-only state file so a
+        restarted crawl skips them."""
+        self.path = path
+        self.done: Set[str] = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                for line in file:
+                    if line.endswith("\n"):
+                        self.done.add(line.rstrip("\n"))
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.done
+
+    def mark(self, key: str) -> None:
+        with self._lock:
+            with open(self.path, "a") as file:
+                file.write(key + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+            self.done.add(key)
+
+
+class ResultWriter:
+    def __init__(self, path: Optional[str], format: str = "jsonl") -> None:
+        """Appends result rows as JSON lines or CSV, to `path` or stdout.
+        Both formats are appendable, so a resumed crawl adds to the same
+        file."""
+        if format not in ("jsonl", "csv"):
+            raise ValueError(f"Unknown output format '{format}'.")
+        self.format = format
+        self._lock = threading.Lock()
+        new_file = path is None or not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = sys.stdout if path is None else open(path, "a", newline="")
+        self._csv = None
+        if format == "csv":
+            self._csv = csv.DictWriter(self.file, fieldnames=CSV_FIELDS, extrasaction="ignore")
+            if new_file:
+                self._csv.writeheader()
+
+    def write(self, rows: Iterable[Dict[str, Any]]) -> None:
+        with self._lock:
+            for row in rows:
+                if self._csv is not None:
+                    self._csv.writerow({
+                        k: json.dumps(v) if isinstance(v, (dict, list)) else v
+                        for k, v in row.items()
+                    })
+                else:
+                    self.file.write(json.dumps(row) + "\n")
+            self.file.flush()
+
+    def close(self) -> None:
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+def run_unit(
+    unit: Dict[str, Any],
+    backend: Optional[SearchBackend] = None,
+    delay: float = 0.0,
+    delta: Optional[DeltaFetcher] = None,
+) -> List[Dict[str, Any]]:
+    search = Search(unit["query"], unit["city"], unit["category"], backend=backend)
+    filters = SearchFilters(**unit["filters"]) if unit["filters"] else None
+    if unit.get("shard"):
+        # One shard at a time, so --concurrency and --delay still bound the
+        # requests made to a host.
+        status = search.fetch_sharded(
+            max_workers=1, delay=delay, sort_by=unit["sort_by"], filters=filters
+        )
+    else:
+        status = search.fetch(sort_by=unit["sort_by"], filters=filters)
+    if status != 200:
+        raise RuntimeError(f"Unable to fetch search with status <{status}>.")
+
+    failed = 0
+    if unit["fetch_ads"] and delta is not None:
+        for ad in delta.fetch(search.ads, delay=delay)["failed"]:
+            print(f"Unable to fetch ad '{ad.url}'.", file=sys.stderr)
+            failed += 1
+    elif unit["fetch_ads"]:
+        for ad in search.ads:
+            if delay > 0:
+                time.sleep(delay)
+            status = ad.fetch()
+            if status != 200:
+                print(f"Unable to fetch ad '{ad.url}' with status <{status}>.", file=sys.stderr)
+                failed += 1
+    # Fail the whole unit so it is not checkpointed and a resumed crawl
+    # retries it. With a delta database, the ads that did succeed are not
+    # fetched again.
+    if failed:
+        raise RuntimeError(f"Unable to fetch {failed} of {len(search.ads)} ads.")
+
+    rows = []
+    for ad in search.ads:
+        rows.append({
+            "query": unit["query"],
+            "city": unit["city"],
+            "category": unit["category"],
+            **ad.to_dict(),
+        })
+    return rows
+
+
+def run_crawl(
+    jobs: List[Dict[str, Any]],
+    checkpoint: Checkpoint,
+    writer: ResultWriter,
+    concurrency: int = 4,
+    delay: float = 1.0,
+    backend: Optional[SearchBackend] = None,
+    delta: Optional[DeltaFetcher] = None,
+) -> Dict[str, int]:
+    """Runs every unit not already in `checkpoint` and returns counts of
+    done, skipped and failed units. Results are written before a unit is
+    checkpointed, so a crash can repeat a unit's rows but never lose them."""
+    units = [unit for job in jobs for unit in expand_job(job)]
+    pending = [unit for unit in units if unit_key(unit) not in checkpoint]
+    counts = {"done": 0, "skipped": len(units) - len(pending), "failed": 0}
+
+    def work(unit: Dict[str, Any]) -> None:
+        rows = run_unit(unit, backend=backend, delay=delay, delta=delta)
+        writer.write(rows)
+        checkpoint.mark(unit_key(unit))
+        if delay > 0:
+            time.sleep(delay)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {executor.submit(work, unit): unit for unit in pending}
+        for future in as_completed(futures):
+            unit = futures[future]
+            try:
+                future.result()
+                counts["done"] += 1
+            except Exception as e:
+                counts["failed"] += 1
+                print(
+                    f"Failed '{unit['query']}' in {unit['city']}/{unit['category']}: {e}",
+                    file=sys.stderr,
+                )
+    return counts
+
+
+def crawl_command(args: argparse.Namespace) -> int:
+    jobs = load_jobs(args.jobs)
+    state = args.state or args.jobs + ".state"
+    backend = JSONSearchBackend() if args.backend == "json" else None
+    delta = None
+    if args.delta_db:
+        delta = DeltaFetcher(FingerprintStore(args.delta_db), reverify_after=args.reverify_after)
+    writer = ResultWriter(args.output, args.format)
+    try:
+        counts = run_crawl(
+            jobs,
+            Checkpoint(state),
+            writer,
+            concurrency=args.concurrency,
+            delay=args.delay,
+            backend=backend,
+            delta=delta,
+        )
+    finally:
+        writer.close()
+    print(
+        f"{counts['done']} units done, {counts['skipped']} already done, "
+        f"{counts['failed']} failed.",
+        file=sys.stderr,
+    )
+    return 1 if counts["failed"] else 0
+
+
+def queue_command(args: argparse.Namespace) -> int:
+    queue = SQLiteWorkQueue(args.db, max_attempts=args.max_attempts)
+    if args.queue_command == "plan":
+        added = CrawlCoordinator(queue).plan(
+            args.queries,
+            hostnames=args.cities,
+            categories=args.categories or ["sss"],
+            pages=args.pages,
+            fetch_ads=args.fetch_ads,
+        )
+        print(f"Enqueued {added} new tasks.", file=sys.stderr)
+    elif args.queue_command == "work":
+        worker = Worker(queue, lease_seconds=args.lease_seconds, delay=args.delay)
+        processed = worker.run(max_tasks=args.max_tasks, idle_timeout=args.idle_timeout)
+        print(f"Processed {processed} tasks.", file=sys.stderr)
+    elif args.queue_command == "requeue-dead":
+        print(f"Requeued {queue.requeue_dead()} tasks.", file=sys.stderr)
+    print(json.dumps(queue.counts()))
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="craigslistscraper")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    crawl = commands.add_parser(
+        "crawl",
+        help="Run the searches in a job file, resuming unfinished work.",
+    )
+    crawl.add_argument("jobs", help="JSON-lines file with one job per line.")
+    crawl.add_argument("-o", "--output", help="Output file (default: stdout).")
+    crawl.add_argument("-f", "--format", choices=["jsonl", "csv"], default="jsonl")
+    crawl.add_argument("--state", help="Checkpoint file (default: <jobs>.state).")
+    crawl.add_argument("-c", "--concurrency", type=int, default=4)
+    crawl.add_argument("--delay", type=float, default=1.0, help="Seconds between requests per worker.")
+    crawl.add_argument("--backend", choices=["html", "json"], default="html")
+    crawl.add_argument(
+        "--delta-db",
+        help="Fingerprint database; only fetch ads that are new or whose search row changed.",
+    )
+    crawl.add_argument(
+        "--reverify-after",
+        type=float,
+        help="With --delta-db, also re-fetch a few unchanged ads older than this many seconds.",
+    )
+    crawl.set_defaults(func=crawl_command)
+
+    queue = commands.add_parser(
+        "queue",
+        help="Plan and run a distributed crawl over a lease-based SQLite work queue.",
+    )
+    queue.add_argument("--db", default="crawl.sqlite", help="Path to the queue file.")
+    queue.add_argument("--max-attempts", type=int, default=3)
+    queue_commands = queue.add_subparsers(dest="queue_command", required=True)
+
+    plan = queue_commands.add_parser("plan", help="Enqueue search tasks.")
+    plan.add_argument("queries", nargs="+")
+    plan.add_argument("--city", action="append", dest="cities", help="Defaults to all.")
+    plan.add_argument("--category", action="append", dest="categories")
+    plan.add_argument("--pages", type=int, default=1)
+    plan.add_argument("--fetch-ads", action="store_true")
+
+    work = queue_commands.add_parser("work", help="Run a worker.")
+    work.add_argument("--max-tasks", type=int)
+    work.add_argument("--idle-timeout", type=float, default=10.0)
+    work.add_argument("--lease-seconds", type=float, default=60.0)
+    work.add_argument("--delay", type=float, default=1.0)
+
+    queue_commands.add_parser("status", help="Show task counts.")
+    queue_commands.add_parser("requeue-dead", help="Retry dead-lettered tasks.")
+    queue.set_defaults(func=queue_command)
+
+    args = parser.parse_args(argv)
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
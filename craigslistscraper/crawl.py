@@ -0,0 +1,403 @@
+from abc import ABC, abstractmethod
+import itertools
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from .ad import Ad
+from .search import PAGE_SIZE, Search
+from .utils import ThreadLocalSQLite, get_areas
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+DEAD = "dead"
+
+
+class Task:
+    def __init__(
+        self,
+        id: int,
+        kind: str,
+        payload: Dict[str, Any],
+        attempts: int = 0,
+        lease_token: Optional[str] = None,
+    ) -> None:
+        """A unit of crawl work. `kind` is either "search" (payload has the
+        query, city, category and page) or "ad" (payload has the url)."""
+        self.id = id
+        self.kind = kind
+        self.payload = payload
+        self.attempts = attempts
+        self.lease_token = lease_token
+
+    def __repr__(self) -> str:
+        return f"< Task {self.id} {self.kind} {self.payload} >"
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "payload": self.payload,
+            "attempts": self.attempts,
+        }
+
+
+def task_key(kind: str, payload: Dict[str, Any]) -> str:
+    """A stable key used to de-duplicate tasks on enqueue."""
+    return kind + ":" + json.dumps(payload, sort_keys=True)
+
+
+class WorkQueue(ABC):
+    """The interface a crawl queue backend has to implement. Tasks are leased
+    to one worker at a time; a lease that is not acked or failed before it
+    expires makes the task available again. Tasks that fail `max_attempts`
+    times are moved to the dead-letter state instead of being retried.
+
+    `SQLiteWorkQueue` is enough for a single host. A networked backend (for
+    example on Redis) only needs to implement these methods to be used by the
+    `CrawlCoordinator` and `Worker`.
+    """
+
+    @abstractmethod
+    def put(self, kind: str, payload: Dict[str, Any]) -> bool:
+        """Enqueues a task. Returns False if an identical task already exists."""
+        raise NotImplementedError
+
+    def put_many(self, tasks: Iterable[Dict[str, Any]]) -> int:
+        return sum(self.put(task["kind"], task["payload"]) for task in tasks)
+
+    @abstractmethod
+    def lease(self, worker_id: str, lease_seconds: float) -> Optional[Task]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def extend(self, task: Task, lease_seconds: float) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def ack(self, task: Task, result: Any = None) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def fail(self, task: Task, error: str, retry_delay: float = 0.0) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def dead_letters(self) -> List[Task]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def requeue_dead(self) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def counts(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def results(self, kind: Optional[str] = None) -> List[Dict]:
+        """The kind, payload and stored result of every finished task."""
+        raise NotImplementedError
+
+
+class SQLiteWorkQueue(WorkQueue):
+    def __init__(self, path: str, max_attempts: int = 3) -> None:
+        """A durable `WorkQueue` in a single SQLite file. Any number of
+        processes on the same host can share the file."""
+        self.path = path
+        self.max_attempts = max_attempts
+        self._db = ThreadLocalSQLite(path)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    key TEXT UNIQUE NOT NULL,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    available_at REAL NOT NULL DEFAULT 0,
+                    lease_expires REAL,
+                    lease_token TEXT,
+                    result TEXT,
+                    error TEXT
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, available_at)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return self._db.connect()
+
+    def put(self, kind: str, payload: Dict[str, Any]) -> bool:
+        cursor = self._connect().execute(
+            "INSERT OR IGNORE INTO tasks (key, kind, payload) VALUES (?, ?, ?)",
+            (task_key(kind, payload), kind, json.dumps(payload)),
+        )
+        return cursor.rowcount == 1
+
+    def put_many(self, tasks: Iterable[Dict[str, Any]]) -> int:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO tasks (key, kind, payload) VALUES (?, ?, ?)",
+                (
+                    (task_key(t["kind"], t["payload"]), t["kind"], json.dumps(t["payload"]))
+                    for t in tasks
+                ),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return conn.total_changes - before
+
+    def lease(self, worker_id: str, lease_seconds: float) -> Optional[Task]:
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Expired leases that used up their attempts are dead-lettered.
+            conn.execute(
+                "UPDATE tasks SET state = ?, error = 'lease expired' "
+                "WHERE state = ? AND lease_expires < ? AND attempts >= ?",
+                (DEAD, LEASED, now, self.max_attempts),
+            )
+            row = conn.execute(
+                "SELECT id, kind, payload, attempts FROM tasks "
+                "WHERE (state = ? AND available_at <= ?) "
+                "OR (state = ? AND lease_expires < ?) "
+                "ORDER BY id LIMIT 1",
+                (PENDING, now, LEASED, now),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            token = f"{worker_id}:{row[0]}:{row[3] + 1}"
+            conn.execute(
+                "UPDATE tasks SET state = ?, attempts = attempts + 1, "
+                "lease_expires = ?, lease_token = ? WHERE id = ?",
+                (LEASED, now + lease_seconds, token, row[0]),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return Task(row[0], row[1], json.loads(row[2]), row[3] + 1, token)
+
+    def extend(self, task: Task, lease_seconds: float) -> bool:
+        cursor = self._connect().execute(
+            "UPDATE tasks SET lease_expires = ? "
+            "WHERE id = ? AND state = ? AND lease_token = ?",
+            (time.time() + lease_seconds, task.id, LEASED, task.lease_token),
+        )
+        return cursor.rowcount == 1
+
+    def ack(self, task: Task, result: Any = None) -> bool:
+        cursor = self._connect().execute(
+            "UPDATE tasks SET state = ?, result = ?, lease_expires = NULL "
+            "WHERE id = ? AND state = ? AND lease_token = ?",
+            (DONE, json.dumps(result), task.id, LEASED, task.lease_token),
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, task: Task, error: str, retry_delay: float = 0.0) -> bool:
+        state = DEAD if task.attempts >= self.max_attempts else PENDING
+        cursor = self._connect().execute(
+            "UPDATE tasks SET state = ?, error = ?, available_at = ?, "
+            "lease_expires = NULL WHERE id = ? AND state = ? AND lease_token = ?",
+            (state, error, time.time() + retry_delay, task.id, LEASED, task.lease_token),
+        )
+        return cursor.rowcount == 1
+
+    def dead_letters(self) -> List[Task]:
+        rows = self._connect().execute(
+            "SELECT id, kind, payload, attempts FROM tasks WHERE state = ? ORDER BY id",
+            (DEAD,),
+        ).fetchall()
+        return [Task(r[0], r[1], json.loads(r[2]), r[3]) for r in rows]
+
+    def requeue_dead(self) -> int:
+        cursor = self._connect().execute(
+            "UPDATE tasks SET state = ?, attempts = 0, available_at = 0, error = NULL "
+            "WHERE state = ?",
+            (PENDING, DEAD),
+        )
+        return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._connect().execute(
+            "SELECT state, COUNT(*) FROM tasks GROUP BY state"
+        ).fetchall()
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, DEAD: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def results(self, kind: Optional[str] = None) -> List[Dict]:
+        """The stored results of finished tasks."""
+        sql = "SELECT kind, payload, result FROM tasks WHERE state = ?"
+        args: List[Any] = [DONE]
+        if kind is not None:
+            sql += " AND kind = ?"
+            args.append(kind)
+        rows = self._connect().execute(sql + " ORDER BY id", args).fetchall()
+        return [
+            {"kind": r[0], "payload": json.loads(r[1]), "result": json.loads(r[2])}
+            for r in rows
+        ]
+
+
+class CrawlCoordinator:
+    def __init__(self, queue: WorkQueue) -> None:
+        """Splits a crawl into (query x hostname x category x page) search tasks
+        on a `WorkQueue`. Enqueuing is idempotent, so a plan can be re-run."""
+        self.queue = queue
+
+    def plan(
+        self,
+        queries: Iterable[str],
+        hostnames: Optional[Iterable[str]] = None,
+        categories: Iterable[str] = ("sss",),
+        pages: int = 1,
+        fetch_ads: bool = False,
+    ) -> int:
+        """Enqueues the search tasks and returns how many were new. With no
+        `hostnames` every hostname in areas.json is used."""
+        if hostnames is None:
+            hostnames = sorted({area["Hostname"] for area in get_areas()})
+        tasks = (
+            {
+                "kind": "search",
+                "payload": {
+                    "query": query,
+                    "city": city,
+                    "category": category,
+                    "page": page,
+                    "fetch_ads": fetch_ads,
+                },
+            }
+            for query, city, category, page in itertools.product(
+                list(queries), list(hostnames), list(categories), range(pages)
+            )
+        )
+        return self.queue.put_many(tasks)
+
+
+class Worker:
+    def __init__(
+        self,
+        queue: WorkQueue,
+        worker_id: Optional[str] = None,
+        lease_seconds: float = 60.0,
+        retry_delay: float = 30.0,
+        max_retry_delay: float = 3600.0,
+        delay: float = 0.0,
+        timeout: float = 30.0,
+        **kwargs
+    ) -> None:
+        """Leases tasks from a `WorkQueue` and runs the matching `Search` or
+        `Ad` fetch. Search tasks with `fetch_ads` set enqueue one ad task per
+        result. Any `kwargs` are passed to the fetches (and so to
+        `requests.get`), with a default `timeout` in seconds.
+
+        The lease is extended every third of `lease_seconds` while a task
+        runs, so a slow fetch is not handed to a second worker. A failed
+        task is retried after `retry_delay` seconds, doubling with each
+        attempt up to `max_retry_delay`.
+        """
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.delay = delay
+        kwargs.setdefault("timeout", timeout)
+        self.kwargs = kwargs
+
+    def process(self, task: Task) -> Any:
+        if task.kind == "search":
+            return self._search(task.payload)
+        if task.kind == "ad":
+            return self._ad(task.payload)
+        raise ValueError(f"Unknown task kind '{task.kind}'.")
+
+    def _search(self, payload: Dict[str, Any]) -> Dict:
+        search = Search(payload["query"], payload["city"], payload.get("category", "sss"))
+        kwargs = dict(self.kwargs)
+        page = payload.get("page", 0)
+        if page:
+            kwargs["params"] = {**(kwargs.get("params") or {}), "s": page * PAGE_SIZE}
+        status = search.fetch(**kwargs)
+        if status != 200:
+            raise RuntimeError(f"Search fetch failed with status <{status}>.")
+        if payload.get("fetch_ads"):
+            self.queue.put_many(
+                {"kind": "ad", "payload": {"url": ad.url}} for ad in search.ads
+            )
+        return search.to_dict()
+
+    def _ad(self, payload: Dict[str, Any]) -> Dict:
+        ad = Ad(url=payload["url"])
+        status = ad.fetch(**self.kwargs)
+        if status != 200:
+            raise RuntimeError(f"Ad fetch failed with status <{status}>.")
+        return ad.to_dict()
+
+    def backoff(self, task: Task) -> float:
+        """Seconds to wait before retrying `task` after its latest attempt."""
+        return min(self.retry_delay * 2 ** max(task.attempts - 1, 0), self.max_retry_delay)
+
+    def _keep_leased(self, task: Task, done: threading.Event) -> None:
+        while not done.wait(self.lease_seconds / 3):
+            if not self.queue.extend(task, self.lease_seconds):
+                return  # The lease was lost; the ack or fail will be rejected.
+
+    def run_once(self) -> bool:
+        """Processes a single task. Returns False if the queue had none."""
+        task = self.queue.lease(self.worker_id, self.lease_seconds)
+        if task is None:
+            return False
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._keep_leased, args=(task, done), daemon=True)
+        heartbeat.start()
+        try:
+            result = self.process(task)
+        except Exception as e:
+            done.set()
+            heartbeat.join()
+            self.queue.fail(task, f"{type(e).__name__}: {e}", self.backoff(task))
+        else:
+            done.set()
+            heartbeat.join()
+            self.queue.ack(task, result)
+        if self.delay > 0:
+            time.sleep(self.delay)
+        return True
+
+    def run(self, max_tasks: Optional[int] = None, idle_timeout: float = 0.0) -> int:
+        """Processes tasks until `max_tasks` are done or the queue has been
+        empty for `idle_timeout` seconds. Returns the number processed."""
+        processed = 0
+        idle_since = None
+        while max_tasks is None or processed < max_tasks:
+            if self.run_once():
+                processed += 1
+                idle_since = None
+                continue
+            idle_since = idle_since or time.monotonic()
+            if time.monotonic() - idle_since >= idle_timeout:
+                break
+            time.sleep(min(1.0, idle_timeout))
+        return processed
+
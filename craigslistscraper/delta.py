@@ -0,0 +1,168 @@
+import hashlib
+import json
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .ad import Ad
+from .metrics import metrics
+from .utils import ThreadLocalSQLite
+
+
+def fingerprint(ad: Ad) -> str:
+    """A hash of the fields a search-results row carries for an ad."""
+    row = json.dumps([ad.url, ad.title, ad.price])
+    return hashlib.sha1(row.encode("utf-8")).hexdigest()
+
+
+class FingerprintStore:
+    def __init__(self, path: str) -> None:
+        """Per-d_pid search-row fingerprints and the last fetched details,
+        kept in a SQLite file."""
+        self.path = path
+        self._db = ThreadLocalSQLite(path)
+        self._connect().execute(
+            """
+            CREATE TABLE IF NOT EXISTS ads (
+                d_pid INTEGER PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                last_fetched REAL NOT NULL,
+                details TEXT NOT NULL
+            )
+            """
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        return self._db.connect()
+
+    def get_many(self, d_pids: Iterable[int]) -> Dict[int, Dict]:
+        d_pids = list(d_pids)
+        found: Dict[int, Dict] = {}
+        # Stay well below SQLite's limit on bound parameters.
+        for start in range(0, len(d_pids), 500):
+            chunk = d_pids[start:start + 500]
+            rows = self._connect().execute(
+                "SELECT d_pid, fingerprint, last_fetched, details FROM ads "
+                f"WHERE d_pid IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall()
+            for d_pid, fp, last_fetched, details in rows:
+                found[d_pid] = {
+                    "fingerprint": fp,
+                    "last_fetched": last_fetched,
+                    "details": json.loads(details),
+                }
+        return found
+
+    def put(self, ad: Ad, fp: str, now: Optional[float] = None, d_pid: Optional[int] = None) -> None:
+        now = time.time() if now is None else now
+        self._connect().execute(
+            "INSERT INTO ads (d_pid, fingerprint, first_seen, last_seen, last_fetched, details) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(d_pid) DO UPDATE SET fingerprint = excluded.fingerprint, "
+            "last_seen = excluded.last_seen, last_fetched = excluded.last_fetched, "
+            "details = excluded.details",
+            (ad.d_pid if d_pid is None else d_pid, fp, now, now, now, json.dumps(ad.to_dict())),
+        )
+
+    def touch(self, d_pids: Iterable[int], now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        self._connect().executemany(
+            "UPDATE ads SET last_seen = ? WHERE d_pid = ?",
+            ((now, d_pid) for d_pid in d_pids),
+        )
+
+
+class DeltaFetcher:
+    def __init__(
+        self,
+        store: FingerprintStore,
+        reverify_after: Optional[float] = None,
+        reverify_limit: int = 5,
+    ) -> None:
+        """Only calls `Ad.fetch` for ads that are new or whose search-row
+        fingerprint (url, title, price) changed since they were last fetched,
+        e.g. after a price drop.
+
+        Unchanged ads are filled in from the details stored at their last
+        fetch instead. If `reverify_after` is set, up to `reverify_limit`
+        unchanged ads per call whose last fetch is older than that many
+        seconds are fetched again anyway, oldest first, to catch edits that
+        don't show up in the search row.
+        """
+        self.store = store
+        self.reverify_after = reverify_after
+        self.reverify_limit = reverify_limit
+
+    def select(self, ads: List[Ad], now: Optional[float] = None) -> List[Ad]:
+        """The ads that need a detail fetch."""
+        return self._plan(ads, time.time() if now is None else now)[0]
+
+    def _plan(self, ads: List[Ad], now: float) -> Tuple[List[Ad], List[Ad], Dict[int, Dict]]:
+        known = self.store.get_many(ad.d_pid for ad in ads if ad.d_pid is not None)
+        changed: List[Ad] = []
+        unchanged: List[Ad] = []
+        stale: List[Ad] = []
+        for ad in ads:
+            stored = known.get(ad.d_pid) if ad.d_pid is not None else None
+            if stored is None or stored["fingerprint"] != fingerprint(ad):
+                changed.append(ad)
+                continue
+            unchanged.append(ad)
+            if (
+                self.reverify_after is not None
+                and now - stored["last_fetched"] >= self.reverify_after
+            ):
+                stale.append(ad)
+
+        stale.sort(key=lambda ad: known[ad.d_pid]["last_fetched"])
+        reverify = stale[: self.reverify_limit]
+        return changed + reverify, unchanged, known
+
+    def fetch(
+        self,
+        ads: List[Ad],
+        hydrate: bool = True,
+        delay: float = 0.0,
+        **kwargs
+    ) -> Dict[str, List[Ad]]:
+        """Fetches the ads that need it, `delay` seconds apart, and returns
+        them by outcome under "fetched", "failed" and "skipped". With
+        `hydrate`, skipped ads get the description, attributes, tags and images
+        from their stored details. `kwargs` go to `Ad.fetch`."""
+        now = time.time()
+        to_fetch, unchanged, known = self._plan(ads, now)
+        fetching = {id(ad) for ad in to_fetch}
+        result: Dict[str, List[Ad]] = {"fetched": [], "failed": [], "skipped": []}
+
+        for ad in to_fetch:
+            # The row fingerprint and d_pid have to be taken before fetch()
+            # overwrites them with the ones from the ad page.
+            fp, d_pid = fingerprint(ad), ad.d_pid
+            if delay > 0:
+                time.sleep(delay)
+            status = ad.fetch(**kwargs)
+            if status != 200:
+                result["failed"].append(ad)
+                continue
+            if d_pid is not None or ad.d_pid is not None:
+                self.store.put(ad, fp, now, d_pid=d_pid)
+            result["fetched"].append(ad)
+
+        skipped = [ad for ad in unchanged if id(ad) not in fetching]
+        for ad in skipped:
+            if hydrate:
+                details = known[ad.d_pid]["details"]
+                ad.description = details.get("description")
+                ad.attributes = details.get("attributes")
+                ad.image_urls = details.get("image_urls")
+                ad.tags = details.get("tags")
+            result["skipped"].append(ad)
+        self.store.touch((ad.d_pid for ad in skipped), now)
+
+        metrics.incr("delta_fetched", len(result["fetched"]))
+        metrics.incr("delta_failed", len(result["failed"]))
+        metrics.incr("delta_skipped", len(result["skipped"]))
+        return result
@@ -0,0 +1,151 @@
+import re
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from .ad import Ad
+
+COLUMNS = (
+    "d_pid",
+    "year",
+    "odometer",
+    "condition",
+    "bedrooms",
+    "bathrooms",
+    "sqft",
+    "vin",
+)
+
+# All patterns are compiled once at import time and shared by every extractor.
+YEAR_RE = re.compile(r"(?<!\d)(19[0-9]{2}|20[0-9]{2})(?!\d)")
+NUMBER_RE = re.compile(r"(\d[\d,]*(?:\.\d+)?)\s*(k\b)?", re.IGNORECASE)
+BEDROOMS_RE = re.compile(r"(\d+)\s*br\b", re.IGNORECASE)
+BATHROOMS_RE = re.compile(r"(\d+(?:\.\d+)?)\s*ba\b", re.IGNORECASE)
+SQFT_RE = re.compile(
+    r"(\d[\d,]*)\s*(?:ft2|ft²|sq\.?\s*ft\.?|sqft)(?![a-z])", re.IGNORECASE
+)
+# The year/make/model attribute, e.g. "2008 bmw 328i".
+YEAR_TAG_RE = re.compile(r"^(19[0-9]{2}|20[0-9]{2})\s+[a-z]", re.IGNORECASE)
+# Matched against uppercased text: 17 characters without I, O or Q, at least
+# one of them a letter so plain 17-digit numbers are not taken for VINs.
+VIN_RE = re.compile(r"\b(?=[A-HJ-NPR-Z0-9]*[A-HJ-NPR-Z])([A-HJ-NPR-Z0-9]{17})\b")
+
+# The attribute keys Craigslist uses for each field, lowercased.
+YEAR_KEYS = ("year", "model year")
+ODOMETER_KEYS = ("odometer", "miles", "mileage")
+CONDITION_KEYS = ("condition",)
+VIN_KEYS = ("vin",)
+
+AdLike = Union[Ad, Dict[str, Any]]
+
+
+def parse_number(text: str) -> Optional[float]:
+    """Parses the first number in `text`, honouring thousands separators and
+    a trailing "k" (e.g. "123,456" -> 123456.0, "98k" -> 98000.0)."""
+    match = NUMBER_RE.search(text)
+    if match is None:
+        return None
+    try:
+        value = float(match.group(1).replace(",", ""))
+    except ValueError:
+        return None
+    return value * 1000 if match.group(2) else value
+
+
+class AttributeExtractor:
+    def __init__(self, max_year: int = 2100) -> None:
+        """Turns the raw `Ad.attributes` strings, `Ad.tags` and the ad title
+        into typed columns: year, odometer, condition, bedrooms, bathrooms, sqft and VIN.
+
+        `extract()` handles a single ad and `extract_batch()` returns the same
+        fields for many ads as a dict of columns, ready for filtering or for
+        `pandas.DataFrame(...)`.
+        """
+        self.max_year = max_year
+
+    def extract(
+        self,
+        title: Optional[str],
+        attributes: Optional[Dict],
+        tags: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        attrs = {k.strip().lower(): v.strip() for k, v in (attributes or {}).items()}
+        title = title or ""
+        tags = [tag.strip() for tag in tags or []]
+        # Housing and size info can show up in the title, a value or a tag.
+        text = " ".join([title, *attrs.values(), *tags])
+
+        return {
+            "year": self._year(title, attrs, tags),
+            "odometer": self._odometer(attrs),
+            "condition": (_first(attrs, CONDITION_KEYS) or "").lower() or None,
+            "bedrooms": _int_match(BEDROOMS_RE, text),
+            "bathrooms": _float_match(BATHROOMS_RE, text),
+            "sqft": _int_match(SQFT_RE, text),
+            "vin": self._vin(text, attrs),
+        }
+
+    def extract_ad(self, ad: AdLike) -> Dict[str, Any]:
+        if isinstance(ad, dict):
+            row = self.extract(ad.get("title"), ad.get("attributes"), ad.get("tags"))
+            row["d_pid"] = ad.get("d_pid")
+        else:
+            row = self.extract(ad.title, ad.attributes, ad.tags)
+            row["d_pid"] = ad.d_pid
+        return row
+
+    def extract_batch(self, ads: Iterable[AdLike]) -> Dict[str, List[Any]]:
+        columns: Dict[str, List[Any]] = {name: [] for name in COLUMNS}
+        for ad in ads:
+            row = self.extract_ad(ad)
+            for name in COLUMNS:
+                columns[name].append(row[name])
+        return columns
+
+    def _year(self, title: str, attrs: Dict[str, str], tags: List[str]) -> Optional[int]:
+        value = _first(attrs, YEAR_KEYS)
+        candidates = [value] if value else []
+        year_tags = [tag for tag in tags if YEAR_TAG_RE.match(tag)]
+        candidates.extend(year_tags)
+        # Anywhere else in a title a year is as likely to be a street number
+        # or a price, so only trust it for vehicles or at the very start.
+        vehicle = bool(year_tags) or _first(attrs, ODOMETER_KEYS) is not None
+        if vehicle or YEAR_TAG_RE.match(title.strip()):
+            candidates.append(title)
+        for text in candidates:
+            for match in YEAR_RE.finditer(text):
+                year = int(match.group(1))
+                if year <= self.max_year:
+                    return year
+        return None
+
+    def _odometer(self, attrs: Dict[str, str]) -> Optional[int]:
+        value = _first(attrs, ODOMETER_KEYS)
+        number = parse_number(value) if value else None
+        return int(number) if number is not None else None
+
+    def _vin(self, text: str, attrs: Dict[str, str]) -> Optional[str]:
+        # Free text is only scanned when the ad has no VIN attribute.
+        value = _first(attrs, VIN_KEYS)
+        match = VIN_RE.search((value or text).upper())
+        return match.group(1) if match else None
+
+
+def _first(attrs: Dict[str, str], keys: Iterable[str]) -> Optional[str]:
+    for key in keys:
+        if attrs.get(key):
+            return attrs[key]
+    return None
+
+
+def _int_match(pattern: "re.Pattern", text: str) -> Optional[int]:
+    match = pattern.search(text)
+    return int(match.group(1).replace(",", "")) if match else None
+
+
+def _float_match(pattern: "re.Pattern", text: str) -> Optional[float]:
+    match = pattern.search(text)
+    return float(match.group(1)) if match else None
+
+
+def extract_attributes(ads: Iterable[AdLike]) -> Dict[str, List[Any]]:
+    """Functional way to extract typed columns from many ads at once."""
+    return AttributeExtractor().extract_batch(ads)
@@ -0,0 +1,241 @@
+import re
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .utils import get_categories
+
+# A compiled client-side filter. It is called with the fields available on a
+# search-results row, before an `Ad` is ever built for it.
+Predicate = Callable[[str, Optional[float]], bool]
+
+# Aggregate categories that are not listed in categories.json.
+AGGREGATE_CATEGORY_TYPES = {
+    "sss": "S",
+    "cta": "S",
+    "hhh": "H",
+    "jjj": "J",
+    "bbb": "B",
+    "ccc": "C",
+    "eee": "E",
+    "ggg": "G",
+    "rrr": "R",
+}
+
+VEHICLE_CATEGORIES = {"cta", "cto", "ctd", "mcy", "mcd", "rvs", "rvd"}
+
+# Filter name -> Craigslist query-string parameter.
+COMMON_PARAMS = {
+    "posted_today": "postedToday",
+    "has_pic": "hasPic",
+    "bundle_duplicates": "bundleDuplicates",
+    "search_nearby": "searchNearby",
+    "title_only": "srchType",
+}
+PRICE_PARAMS = {
+    "min_price": "min_price",
+    "max_price": "max_price",
+}
+VEHICLE_PARAMS = {
+    "min_year": "min_auto_year",
+    "max_year": "max_auto_year",
+    "min_miles": "min_auto_miles",
+    "max_miles": "max_auto_miles",
+}
+HOUSING_PARAMS = {
+    "min_bedrooms": "min_bedrooms",
+    "max_bedrooms": "max_bedrooms",
+    "min_sqft": "minSqft",
+    "max_sqft": "maxSqft",
+}
+
+# Filters that can be checked against a search-results row when the category
+# does not support them server-side.
+CLIENT_SIDE_FILTERS = {"min_price", "max_price"}
+
+
+@lru_cache(maxsize=None)
+def get_category_type(category: str) -> Optional[str]:
+    """Returns the one-letter category type ("S", "H", "J", ...) for a
+    category abbreviation, or None if it is unknown."""
+    if category in AGGREGATE_CATEGORY_TYPES:
+        return AGGREGATE_CATEGORY_TYPES[category]
+    for cat in get_categories():
+        if cat["Abbreviation"] == category:
+            return cat["Type"]
+    return None
+
+
+def supported_params(category: str) -> Dict[str, str]:
+    """The filters Craigslist can apply server-side for a category, mapped to
+    their query-string parameter names."""
+    supported = dict(COMMON_PARAMS)
+    cat_type = get_category_type(category)
+    if cat_type in ("S", "H"):
+        supported.update(PRICE_PARAMS)
+    if category in VEHICLE_CATEGORIES:
+        supported.update(VEHICLE_PARAMS)
+    if cat_type == "H":
+        supported.update(HOUSING_PARAMS)
+    return supported
+
+
+class SearchFilters:
+    def __init__(
+        self,
+        *,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        posted_today: bool = False,
+        has_pic: bool = False,
+        bundle_duplicates: bool = False,
+        search_nearby: bool = False,
+        title_only: bool = False,
+        min_year: Optional[int] = None,
+        max_year: Optional[int] = None,
+        min_miles: Optional[int] = None,
+        max_miles: Optional[int] = None,
+        min_bedrooms: Optional[int] = None,
+        max_bedrooms: Optional[int] = None,
+        min_sqft: Optional[int] = None,
+        max_sqft: Optional[int] = None,
+        require_price: bool = False,
+        exclude_words: Optional[List[str]] = None,
+    ) -> None:
+        """Typed search filters. Unknown filter names raise a `TypeError`
+        instead of silently returning the full result set.
+
+        Filters that Craigslist supports for the searched category are pushed
+        into the query string with `params()`. The rest are compiled by
+        `predicate()` into a single check that `SearchParser` runs on each
+        result row, so rejected rows never become `Ad` objects. A filter that
+        can be applied neither way for a category raises a `ValueError`.
+
+        `require_price` drops rows without a price and `exclude_words` drops
+        rows whose title contains any of the given words; both are always
+        applied client-side.
+        """
+        self.min_price = min_price
+        self.max_price = max_price
+        self.posted_today = posted_today
+        self.has_pic = has_pic
+        self.bundle_duplicates = bundle_duplicates
+        self.search_nearby = search_nearby
+        self.title_only = title_only
+        self.min_year = min_year
+        self.max_year = max_year
+        self.min_miles = min_miles
+        self.max_miles = max_miles
+        self.min_bedrooms = min_bedrooms
+        self.max_bedrooms = max_bedrooms
+        self.min_sqft = min_sqft
+        self.max_sqft = max_sqft
+        self.require_price = require_price
+        self.exclude_words = list(exclude_words or [])
+
+        for low, high in (
+            ("min_price", "max_price"),
+            ("min_year", "max_year"),
+            ("min_miles", "max_miles"),
+            ("min_bedrooms", "max_bedrooms"),
+            ("min_sqft", "max_sqft"),
+        ):
+            lo, hi = getattr(self, low), getattr(self, high)
+            for name, value in ((low, lo), (high, hi)):
+                if value is not None and value < 0:
+                    raise ValueError(f"Filter '{name}' must be non-negative, got {value}.")
+            if lo is not None and hi is not None and lo > hi:
+                raise ValueError(f"Filter '{low}' ({lo}) is greater than '{high}' ({hi}).")
+
+    @classmethod
+    def from_params(cls, params: Dict) -> "SearchFilters":
+        """Builds filters from a Craigslist-style params dict such as
+        `{"max_price": 5000, "postedToday": 1}`. Unknown keys raise a
+        `ValueError`."""
+        reverse = {
+            param: name
+            for mapping in (COMMON_PARAMS, PRICE_PARAMS, VEHICLE_PARAMS, HOUSING_PARAMS)
+            for name, param in mapping.items()
+        }
+        kwargs = {}
+        for key, value in params.items():
+            if key not in reverse:
+                raise ValueError(f"Unknown search filter '{key}'.")
+            name = reverse[key]
+            if name in COMMON_PARAMS:
+                value = bool(value) if key != "srchType" else value == "T"
+            kwargs[name] = value
+        return cls(**kwargs)
+
+    def active(self) -> Dict:
+        """The filters that are actually set, by name."""
+        active = {}
+        for name in (*COMMON_PARAMS, *PRICE_PARAMS, *VEHICLE_PARAMS, *HOUSING_PARAMS):
+            value = getattr(self, name)
+            if value is not None and value is not False:
+                active[name] = value
+        return active
+
+    def params(self, category: str) -> Dict:
+        """The query-string parameters to push to Craigslist for `category`."""
+        return self.compile(category)[0]
+
+    def predicate(self, category: str) -> Optional[Predicate]:
+        """The client-side check for whatever `params()` could not push, or
+        None if there is nothing to check."""
+        return self.compile(category)[1]
+
+    def compile(self, category: str) -> Tuple[Dict, Optional[Predicate]]:
+        supported = supported_params(category)
+        params: Dict = {}
+        client: Dict = {}
+        for name, value in self.active().items():
+            if name in supported:
+                if name == "title_only":
+                    params[supported[name]] = "T"
+                elif isinstance(value, bool):
+                    params[supported[name]] = 1
+                else:
+                    params[supported[name]] = value
+            elif name in CLIENT_SIDE_FILTERS:
+                client[name] = value
+            else:
+                raise ValueError(
+                    f"Filter '{name}' is not supported for category '{category}'."
+                )
+
+        return params, self._compile_predicate(**client)
+
+    def _compile_predicate(
+        self,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+    ) -> Optional[Predicate]:
+        checks: List[Predicate] = []
+        if self.require_price or min_price is not None or max_price is not None:
+            lo = min_price if min_price is not None else float("-inf")
+            hi = max_price if max_price is not None else float("inf")
+            checks.append(lambda title, price: price is not None and lo <= price <= hi)
+        if self.exclude_words:
+            pattern = re.compile(
+                r"\b(?:" + "|".join(re.escape(w) for w in self.exclude_words) + r")\b",
+                re.IGNORECASE,
+            )
+            checks.append(lambda title, price: pattern.search(title) is None)
+
+        if not checks:
+            return None
+        if len(checks) == 1:
+            return checks[0]
+        return lambda title, price: all(check(title, price) for check in checks)
+
+    def to_dict(self) -> Dict:
+        data = self.active()
+        if self.require_price:
+            data["require_price"] = True
+        if self.exclude_words:
+            data["exclude_words"] = list(self.exclude_words)
+        return data
+
+    def __repr__(self) -> str:
+        args = ", ".join(f"{k}={v!r}" for k, v in self.to_dict().items())
+        return f"SearchFilters({args})"
@@ -0,0 +1,236 @@
+import json
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union
+
+import requests
+
+from .ad import Ad
+from .filters import Predicate
+from .search import HTMLSearchBackend, Search, SearchBackend
+from .utils import get_areas, get_categories
+
+if TYPE_CHECKING:
+    from .archive import Archive
+
+SAPI_URL = "https://sapi.craigslist.org/web/v8/postings/search/full"
+IMAGE_URL = "https://images.craigslist.org/{}_600x450.jpg"
+
+# Tags of the optional list fields inside an encoded posting.
+IMAGES_FIELD = 4
+SLUG_FIELD = 6
+
+# Postings per request. The `batch` param is "<area id>-<offset>-<count>-0-0".
+BATCH_SIZE = 360
+
+COLUMNS = ("d_pid", "url", "title", "price", "posted", "latitude", "longitude")
+
+
+@lru_cache(maxsize=None)
+def area_ids() -> Dict[str, int]:
+    return {area["Hostname"]: area["AreaID"] for area in get_areas()}
+
+
+@lru_cache(maxsize=None)
+def category_abbreviations() -> Dict[int, str]:
+    return {cat["CategoryID"]: cat["Abbreviation"] for cat in get_categories()}
+
+
+class SearchJSONParser:
+    def __init__(
+        self,
+        content: Union[str, bytes],
+        predicate: Optional[Predicate] = None,
+        hostname: Optional[str] = None,
+    ) -> None:
+        """Decodes a response from Craigslist's JSON search endpoint, the one
+        its own frontend uses.
+
+        Postings come back as compact arrays: the posting id and date are
+        offsets from `minPostingId` and `minPostedDate` in the `decode`
+        block, followed by the category id, the price, an encoded location,
+        optional tagged lists (images, url slug, ...) and the title last.
+        `hostname` is used for posting urls when the location does not name
+        one.
+        """
+        data = json.loads(content)
+        self.data: Dict[str, Any] = data.get("data") or {}
+        self.decode: Dict[str, Any] = self.data.get("decode") or {}
+        self.items: List[List[Any]] = self.data.get("items") or []
+        self.predicate = predicate
+        self.hostname = hostname
+
+    @property
+    def total(self) -> Optional[int]:
+        return self.data.get("totalResultCount")
+
+    def _location(self, encoded: Any) -> Tuple[Optional[str], Optional[str], Optional[float], Optional[float]]:
+        """Returns the hostname, sub-area, latitude and longitude of an
+        encoded "<location index>:<...>~<lat>~<lon>" string."""
+        hostname, sub_area, lat, lon = self.hostname, None, None, None
+        if not isinstance(encoded, str):
+            return hostname, sub_area, lat, lon
+        parts = encoded.split("~")
+        index = parts[0].split(":")[0]
+        locations = self.decode.get("locations") or []
+        if index.isdigit() and int(index) < len(locations):
+            location = locations[int(index)]
+            if len(location) > 1 and location[1]:
+                hostname = location[1]
+            if len(location) > 2 and location[2]:
+                sub_area = location[2]
+        if len(parts) >= 3:
+            try:
+                lat, lon = float(parts[1]), float(parts[2])
+            except ValueError:
+                pass
+        return hostname, sub_area, lat, lon
+
+    def _decode_item(self, item: List[Any]) -> Optional[Dict[str, Any]]:
+        title = item[-1]
+        price = item[3] if isinstance(item[3], (int, float)) and item[3] >= 0 else None
+        if self.predicate is not None and not self.predicate(title, price):
+            return None
+
+        d_pid = self.decode["minPostingId"] + item[0]
+        posted = self.decode.get("minPostedDate", 0) + item[1]
+        hostname, sub_area, lat, lon = self._location(item[4])
+        slug, images = "", []
+        for field in item[5:-1]:
+            if isinstance(field, list) and field:
+                if field[0] == SLUG_FIELD and len(field) > 1:
+                    slug = field[1]
+                elif field[0] == IMAGES_FIELD:
+                    images = [str(i).split(":")[-1] for i in field[1:]]
+
+        category = category_abbreviations().get(item[2], "sss")
+        path = f"{sub_area}/{category}" if sub_area else category
+        return {
+            "d_pid": d_pid,
+            "url": f"https://{hostname}.craigslist.org/{path}/d/{slug}/{d_pid}.html",
+            "title": title,
+            "price": float(price) if price is not None else None,
+            "posted": posted,
+            "latitude": lat,
+            "longitude": lon,
+            "image_urls": [IMAGE_URL.format(i) for i in images],
+        }
+
+    def _rows(self) -> List[Dict[str, Any]]:
+        rows = []
+        for item in self.items:
+            try:
+                row = self._decode_item(item)
+            except (IndexError, KeyError, TypeError, ValueError) as e:
+                print(f"Error parsing ad: {e}")
+                continue
+            if row is not None:
+                rows.append(row)
+        return rows
+
+    @property
+    def ads(self) -> List[Ad]:
+        return [
+            Ad(
+                url=row["url"],
+                title=row["title"],
+                price=row["price"],
+                d_pid=row["d_pid"],
+                image_urls=row["image_urls"] or None,
+            )
+            for row in self._rows()
+        ]
+
+    @property
+    def columns(self) -> Dict[str, List[Any]]:
+        """The decoded postings as a dict of columns, without building `Ad`
+        objects."""
+        columns: Dict[str, List[Any]] = {name: [] for name in COLUMNS}
+        for row in self._rows():
+            for name in COLUMNS:
+                columns[name].append(row[name])
+        return columns
+
+
+class JSONSearchBackend(SearchBackend):
+    page_size = BATCH_SIZE
+
+    def __init__(
+        self,
+        fallback: Union[SearchBackend, bool, None] = None,
+        base_url: str = SAPI_URL,
+        lang: str = "en",
+        country: str = "US",
+    ) -> None:
+        """Fetches results from Craigslist's JSON search endpoint, which returns
+        far more postings per request than the HTML page. If the request
+        fails or cannot be decoded the `fallback` backend is used instead;
+        it defaults to `HTMLSearchBackend`, pass `fallback=False` to disable
+        it. `base_url` can point at a local stub for testing.
+
+        Pages hold `BATCH_SIZE` postings and the `s` offset param is moved
+        into `batch`. The fallback gets `s` unchanged, so pass
+        `fallback=False` when paging past the first batch (e.g. with
+        `TopKMerge`) to avoid mixing the two page sizes.
+        """
+        self.fallback = HTMLSearchBackend() if fallback is None else fallback or None
+        self.base_url = base_url
+        self.lang = lang
+        self.country = country
+
+    def params(
+        self,
+        search: Search,
+        sort_by: Optional[str] = None,
+        offset: int = 0,
+    ) -> Dict[str, Any]:
+        area_id = area_ids().get(search.city)
+        if area_id is None:
+            raise ValueError(f"Unknown Craigslist hostname '{search.city}'.")
+        params = {
+            "batch": f"{area_id}-{offset}-{BATCH_SIZE}-0-0",
+            "cc": self.country,
+            "lang": self.lang,
+            "searchPath": f"{search.sub_area}/{search.category}" if search.sub_area else search.category,
+        }
+        if search.query:
+            params["query"] = search.query
+        if sort_by:
+            params["sort"] = sort_by
+        return params
+
+    def fetch(
+        self,
+        search: Search,
+        sort_by: Optional[str] = None,
+        predicate: Optional[Predicate] = None,
+        archive: Optional["Archive"] = None,
+        **kwargs
+    ) -> Tuple[requests.Response, List[Ad]]:
+        # The `s` offset of the HTML page is part of `batch` here.
+        extra = dict(kwargs.get("params") or {})
+        offset = int(extra.pop("s", 0) or 0)
+        try:
+            params = self.params(search, sort_by, offset)
+        except ValueError:
+            if self.fallback is None:
+                raise
+            return self.fallback.fetch(search, sort_by, predicate, archive, **kwargs)
+
+        # Filter params use the same names on both endpoints.
+        json_kwargs = {**kwargs, "params": {**params, **extra}}
+        response = requests.get(self.base_url, **json_kwargs)
+        if response.status_code == 200:
+            try:
+                ads = SearchJSONParser(response.content, predicate, search.city).ads
+            except (ValueError, AttributeError) as e:
+                if self.fallback is None:
+                    raise
+                print(f"Error decoding JSON search results, falling back: {e}")
+            else:
+                if archive is not None:
+                    archive.append(response.url, response.content, kind="search_json")
+                return response, ads
+
+        if self.fallback is not None:
+            return self.fallback.fetch(search, sort_by, predicate, archive, **kwargs)
+        return response, []
@@ -0,0 +1,187 @@
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import itertools
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from .ad import Ad
+from .filters import Predicate, SearchFilters
+from .metrics import metrics
+from .search import PAGE_SIZE, Search
+
+INF = float("inf")
+
+# Ascending merge keys for the server-side sort orders. Ads without a price
+# sort last either way. Rows carry no post date, so "date" relies on newer
+# postings having larger ids.
+SORT_KEYS: Dict[str, Callable[[Ad], float]] = {
+    "priceasc": lambda ad: ad.price if ad.price is not None else INF,
+    "pricedsc": lambda ad: -ad.price if ad.price is not None else INF,
+    "date": lambda ad: -ad.d_pid if ad.d_pid is not None else INF,
+}
+
+
+class SortedCursor:
+    def __init__(
+        self,
+        search: Search,
+        sort_by: str,
+        page_size: Optional[int] = None,
+        max_pages: Optional[int] = None,
+        **kwargs
+    ) -> None:
+        """Lazily pages through one search's results in the server's sort
+        order. `page_size` defaults to the search backend's. A page of fewer
+        than `page_size` rows, or one with no d_pids that earlier pages did
+        not already return, is taken to be the last.
+
+        Client-side `filters` are applied here rather than while parsing, so
+        the last page is judged by the rows the server returned, not by the
+        rows left after filtering. A page that fails to fetch raises a
+        `RuntimeError`.
+        """
+        self.search = search
+        self.sort_by = sort_by
+        if page_size is None:
+            page_size = getattr(search.backend, "page_size", PAGE_SIZE)
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.params: Dict = {}
+        self.predicate: Optional[Predicate] = None
+        filters: Optional[SearchFilters] = kwargs.pop("filters", None)
+        if filters is not None:
+            self.params, self.predicate = filters.compile(search.category)
+        self.kwargs = kwargs
+        self.page = 0
+        self.pages_fetched = 0
+        self.exhausted = False
+        self.status: Optional[int] = None
+        self._seen: Set[int] = set()
+
+    def fetch_page(self) -> List[Ad]:
+        if self.exhausted:
+            return []
+        page = Search(
+            self.search.query,
+            self.search.city,
+            self.search.category,
+            backend=self.search.backend,
+            sub_area=self.search.sub_area,
+        )
+        kwargs = dict(self.kwargs)
+        params = {**(kwargs.get("params") or {}), **self.params}
+        if self.page:
+            params["s"] = self.page * self.page_size
+        kwargs["params"] = params
+        self.status = page.fetch(sort_by=self.sort_by, **kwargs)
+        self.page += 1
+        self.pages_fetched += 1
+        metrics.incr("topk_pages_fetched")
+        if self.status != 200:
+            self.exhausted = True
+            raise RuntimeError(
+                f"Unable to fetch page {self.page} of '{page.url}' with status <{self.status}>."
+            )
+
+        d_pids = {ad.d_pid for ad in page.ads if ad.d_pid is not None}
+        # A backend that ignores the offset would serve the same page forever.
+        repeated = bool(d_pids) and d_pids <= self._seen
+        self._seen |= d_pids
+        if len(page.ads) < self.page_size or repeated or (
+            self.max_pages is not None and self.page >= self.max_pages
+        ):
+            self.exhausted = True
+        if self.predicate is None:
+            return page.ads
+        return [ad for ad in page.ads if self.predicate(ad.title, ad.price)]
+
+
+class TopKMerge:
+    def __init__(
+        self,
+        searches: List[Search],
+        k: int,
+        sort_by: str = "priceasc",
+        page_size: Optional[int] = None,
+        max_pages: Optional[int] = None,
+        max_workers: int = 8,
+        **kwargs
+    ) -> None:
+        """A k-way merge of several searches that are each sorted server-side
+        by `sort_by` ("priceasc", "pricedsc" or "date").
+
+        Iterating yields ads in global order. The first page of every search
+        is fetched in parallel; after that a search's next page is fetched
+        only once all of its current page has made it into the output, i.e.
+        only while its next page could still reach the top `k`. Nothing is
+        fetched once `k` ads have been yielded. Duplicate d_pids are dropped.
+        `kwargs` (e.g. `filters`) go to every `Search.fetch`. If any page
+        fails to fetch, iteration raises a `RuntimeError` rather than
+        returning a partial result.
+        """
+        if sort_by not in SORT_KEYS:
+            raise ValueError(
+                f"Cannot merge searches sorted by '{sort_by}', use one of {sorted(SORT_KEYS)}."
+            )
+        self.k = k
+        self.sort_by = sort_by
+        self.key = SORT_KEYS[sort_by]
+        self.max_workers = max_workers
+        self.cursors = [
+            SortedCursor(search, sort_by, page_size, max_pages, **kwargs)
+            for search in searches
+        ]
+
+    @property
+    def pages_fetched(self) -> int:
+        return sum(cursor.pages_fetched for cursor in self.cursors)
+
+    def __iter__(self) -> Iterator[Ad]:
+        if self.k <= 0 or not self.cursors:
+            return
+        # Heap entries: (key, tie-breaker, cursor index, position in page).
+        heap: List[Tuple[float, int, int, int]] = []
+        pages: List[List[Ad]] = [[] for _ in self.cursors]
+        counter = itertools.count()
+
+        def push(index: int, ads: List[Ad]) -> None:
+            # A page can be empty after client-side filtering while later
+            # pages still have matches.
+            cursor = self.cursors[index]
+            while not ads and not cursor.exhausted:
+                ads = cursor.fetch_page()
+            pages[index] = ads
+            if ads:
+                heapq.heappush(heap, (self.key(ads[0]), next(counter), index, 0))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            first_pages = list(executor.map(lambda c: c.fetch_page(), self.cursors))
+        for index, ads in enumerate(first_pages):
+            push(index, ads)
+
+        seen = set()
+        emitted = 0
+        while heap and emitted < self.k:
+            _, _, index, position = heapq.heappop(heap)
+            ad = pages[index][position]
+            if ad.d_pid is None or ad.d_pid not in seen:
+                seen.add(ad.d_pid)
+                emitted += 1
+                yield ad
+
+            position += 1
+            if position < len(pages[index]):
+                key = self.key(pages[index][position])
+                heapq.heappush(heap, (key, next(counter), index, position))
+            elif emitted < self.k:
+                push(index, self.cursors[index].fetch_page())
+
+
+def top_k(
+    searches: List[Search],
+    k: int,
+    sort_by: str = "priceasc",
+    **kwargs
+) -> List[Ad]:
+    """The first `k` ads across `searches` in `sort_by` order, e.g. the 50
+    cheapest across 40 cities. See `TopKMerge`."""
+    return list(TopKMerge(searches, k, sort_by=sort_by, **kwargs))
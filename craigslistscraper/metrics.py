@@ -0,0 +1,34 @@
+import threading
+from typing import Dict, Union
+
+Number = Union[int, float]
+
+
+class Metrics:
+    def __init__(self) -> None:
+        """A small thread-safe bag of named counters. The library records
+        things like bytes read and bytes saved here so that callers can report
+        on them without having to wrap every fetch themselves.
+        """
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Number] = {}
+
+    def incr(self, name: str, value: Number = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def get(self, name: str, default: Number = 0) -> Number:
+        with self._lock:
+            return self._counters.get(name, default)
+
+    def snapshot(self) -> Dict[str, Number]:
+        with self._lock:
+            return dict(self._counters)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+
+
+# The process-wide metrics instance used by the fetch paths.
+metrics = Metrics()
@@ -0,0 +1,189 @@
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from .search import Search
+
+SearchKey = Tuple[str, str, str, Optional[str]]
+
+
+def search_key(search: Search) -> SearchKey:
+    return (search.query, search.city, search.category, search.sub_area)
+
+
+class SearchStats:
+    def __init__(self, search: Search) -> None:
+        """What the scheduler knows about one search: the d_pids already
+        seen, and time-decayed counts of new listings and elapsed time used
+        for the Poisson rate estimate."""
+        self.search = search
+        self.seen: Set[int] = set()
+        self.events = 0.0
+        self.exposure = 0.0
+        self.last_poll: Optional[float] = None
+        self.polls = 0
+
+    def to_dict(self) -> Dict:
+        return {
+            "query": self.search.query,
+            "city": self.search.city,
+            "category": self.search.category,
+            "sub_area": self.search.sub_area,
+            "seen": len(self.seen),
+            "events": self.events,
+            "exposure": self.exposure,
+            "last_poll": self.last_poll,
+            "polls": self.polls,
+        }
+
+
+class RefreshScheduler:
+    def __init__(
+        self,
+        requests_per_hour: float = 600.0,
+        min_interval: float = 60.0,
+        max_interval: float = 86400.0,
+        target_new: float = 1.0,
+        prior_interval: float = 3600.0,
+        half_life: float = 7 * 86400.0,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        """Picks when to re-poll each search from the rate at which new
+        d_pids have shown up in it.
+
+        New listings are treated as a Poisson process. The rate is estimated
+        as (new listings + 1) / (time observed + `prior_interval`), with both
+        counts decayed by `half_life` so the estimate follows changes. Each
+        search is polled about every `target_new / rate` seconds, clamped to
+        [`min_interval`, `max_interval`]. If the polls wanted by all searches
+        exceed `requests_per_hour`, every interval is stretched by the same
+        factor, and `due()` never hands out more polls than the budget has
+        accumulated, with the searches expected to hold the most new
+        listings going first.
+        """
+        self.requests_per_hour = requests_per_hour
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_new = target_new
+        self.prior_interval = prior_interval
+        self.half_life = half_life
+        self.clock = clock
+        self.stats: Dict[SearchKey, SearchStats] = {}
+
+        self._budget = self.requests_per_hour / 3600.0
+        self._tokens = max(1.0, self._budget * self.min_interval)
+        self._capacity = self._tokens
+        self._last_refill = self.clock()
+
+    def add(self, search: Search) -> None:
+        key = search_key(search)
+        if key not in self.stats:
+            self.stats[key] = SearchStats(search)
+
+    def add_many(self, searches: Iterable[Search]) -> None:
+        for search in searches:
+            self.add(search)
+
+    def observe(self, search: Search, d_pids: Iterable[Optional[int]], at: Optional[float] = None) -> int:
+        """Records a poll of `search` that returned `d_pids` and returns how
+        many of them were new. The first poll only establishes a baseline."""
+        self.add(search)
+        stats = self.stats[search_key(search)]
+        at = self.clock() if at is None else at
+
+        new = {pid for pid in d_pids if pid is not None} - stats.seen
+        stats.seen |= new
+        if stats.last_poll is not None:
+            elapsed = max(at - stats.last_poll, 0.0)
+            decay = 0.5 ** (elapsed / self.half_life)
+            stats.events = stats.events * decay + len(new)
+            stats.exposure = stats.exposure * decay + elapsed
+        stats.last_poll = at
+        stats.polls += 1
+        return len(new) if stats.polls > 1 else 0
+
+    def rate(self, search: Search) -> float:
+        """Estimated new listings per second."""
+        stats = self.stats[search_key(search)]
+        return (stats.events + 1.0) / (stats.exposure + self.prior_interval)
+
+    def interval(self, search: Search) -> float:
+        """The poll interval before the budget is applied."""
+        interval = self.target_new / self.rate(search)
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def stretch(self) -> float:
+        """The factor all intervals are multiplied by to fit the budget."""
+        demand = sum(1.0 / self.interval(s.search) for s in self.stats.values())
+        if demand <= self._budget or self._budget <= 0:
+            return 1.0
+        return demand / self._budget
+
+    def next_poll(self, search: Search, stretch: Optional[float] = None) -> float:
+        stats = self.stats[search_key(search)]
+        if stats.last_poll is None:
+            return float("-inf")
+        stretch = self.stretch() if stretch is None else stretch
+        interval = min(self.interval(search) * stretch, self.max_interval)
+        return stats.last_poll + interval
+
+    def _refill(self, now: float) -> None:
+        elapsed = max(now - self._last_refill, 0.0)
+        self._tokens = min(self._capacity, self._tokens + elapsed * self._budget)
+        self._last_refill = now
+
+    def due(self, now: Optional[float] = None) -> List[Search]:
+        """The searches to poll now, within what the budget allows. Searches
+        never polled come first, then those with the most expected new
+        listings. Every search returned spends one token of the budget, so
+        the caller is expected to poll it and `observe()` the results."""
+        now = self.clock() if now is None else now
+        self._refill(now)
+        stretch = self.stretch()
+
+        ready = []
+        for stats in self.stats.values():
+            if self.next_poll(stats.search, stretch) > now:
+                continue
+            if stats.last_poll is None:
+                expected = float("inf")
+            else:
+                expected = self.rate(stats.search) * (now - stats.last_poll)
+            ready.append((expected, stats.search))
+
+        ready.sort(key=lambda item: item[0], reverse=True)
+        searches = [search for _, search in ready[: int(self._tokens)]]
+        self._tokens -= len(searches)
+        return searches
+
+    def time_until_due(self, now: Optional[float] = None) -> float:
+        """Seconds until the next search is due, ignoring the budget."""
+        now = self.clock() if now is None else now
+        if not self.stats:
+            return self.max_interval
+        stretch = self.stretch()
+        earliest = min(self.next_poll(s.search, stretch) for s in self.stats.values())
+        return max(earliest - now, 0.0)
+
+    def refresh_due(self, **kwargs) -> Dict[SearchKey, int]:
+        """Fetches every due search and records the results. Returns the
+        number of new listings per search key; failed fetches are counted
+        against the budget but not observed. `kwargs` go to `Search.fetch`."""
+        new: Dict[SearchKey, int] = {}
+        for search in self.due():
+            status = search.fetch(**kwargs)
+            if status != 200:
+                continue
+            new[search_key(search)] = self.observe(search, [ad.d_pid for ad in search.ads])
+        return new
+
+    def run(self, iterations: Optional[int] = None, **kwargs) -> None:
+        """Polls searches forever (or for `iterations` rounds), sleeping until
+        the next search is due in between."""
+        count = 0
+        while iterations is None or count < iterations:
+            self.refresh_due(**kwargs)
+            count += 1
+            wait = self.time_until_due()
+            if self._tokens < 1 and self._budget > 0:
+                wait = max(wait, (1 - self._tokens) / self._budget)
+            time.sleep(min(wait, self.max_interval))
@@ -1,39 +1,219 @@
+from abc import ABC, abstractmethod
 from bs4 import BeautifulSoup, Tag
+from concurrent.futures import ThreadPoolExecutor
 import requests
 import re
-from typing import Union, List, Dict, Optional
+import time
+from typing import TYPE_CHECKING, Callable, Union, List, Dict, Optional, Tuple
 
 from .ad import Ad
-from .utils import format_price, build_url
+from .filters import SearchFilters, Predicate
+from .singleflight import archive_key, flight, request_key
+from .utils import format_price, build_url, get_sub_areas
+
+if TYPE_CHECKING:
+    from .archive import Archive
+
+# Craigslist serves 120 results per HTML search page, selected with the `s`
+# offset parameter.
+PAGE_SIZE = 120
+
+
+class SearchBackend(ABC):
+    """How a `Search` gets its results. A backend sends the request for a
+    search and turns the response into `Ad` objects, skipping rows rejected
+    by `predicate` and appending the raw body to `archive` if one is given.
+    It returns the response (whose status is the fetch status) and the ads.
+
+    `page_size` is how many rows one request returns; the next page is
+    selected with the `s` offset param.
+    """
+
+    page_size = PAGE_SIZE
+
+    @abstractmethod
+    def fetch(
+        self,
+        search: "Search",
+        sort_by: Optional[str] = None,
+        predicate: Optional[Predicate] = None,
+        archive: Optional["Archive"] = None,
+        **kwargs
+    ) -> Tuple[requests.Response, List[Ad]]:
+        raise NotImplementedError
+
+
+class HTMLSearchBackend(SearchBackend):
+    """Scrapes the static HTML results page with the `SearchParser`."""
+
+    def fetch(
+        self,
+        search: "Search",
+        sort_by: Optional[str] = None,
+        predicate: Optional[Predicate] = None,
+        archive: Optional["Archive"] = None,
+        **kwargs
+    ) -> Tuple[requests.Response, List[Ad]]:
+        final_url = search.url
+        if sort_by:
+            final_url += f"&sort={sort_by}"
+        response = requests.get(final_url, **kwargs)
+        ads: List[Ad] = []
+        if response.status_code == 200:
+            ads = SearchParser(response.content, predicate=predicate).ads
+            if archive is not None:
+                archive.append(response.url, response.content, kind="search")
+        return response, ads
 
 
 class Search:
-    def __init__(self, query: str, city: str, category: str = "sss") -> None:
+    def __init__(
+        self,
+        query: str,
+        city: str,
+        category: str = "sss",
+        backend: Optional[SearchBackend] = None,
+        sub_area: Optional[str] = None,
+    ) -> None:
         """An abstraction for a Craigslist 'Search'. Similar to the 'Ad' this is
         also lazy and follows the same layout with the `fetch()` and `to_dict()`
-        methods.
+        methods. The `backend` decides how results are fetched and defaults to
+        scraping the HTML results page. `sub_area` (e.g. "sby" in "sfbay")
+        restricts the search to part of a metro.
         """
         self.query = query
         self.city = city
         self.category = category
-        self.url = build_url(self.query, self.city, self.category)
+        self.sub_area = sub_area
+        self.backend = backend if backend is not None else HTMLSearchBackend()
+        self.url = build_url(self.query, self.city, self.category, sub_area=self.sub_area)
         self.ads: List[Ad] = []
 
-    def fetch(self, sort_by: Optional[str] = None, **kwargs) -> int:
-        final_url = self.url
-        if sort_by:
-            final_url += f"&sort={sort_by}"
-        self.request = requests.get(final_url, **kwargs)
-        if self.request.status_code == 200:
-            parser = SearchParser(self.request.content)
-            self.ads = parser.ads
-        return self.request.status_code
+    def fetch(
+        self,
+        sort_by: Optional[str] = None,
+        filters: Optional[SearchFilters] = None,
+        archive: Optional["Archive"] = None,
+        **kwargs
+    ) -> int:
+        """Fetch the search results. Server-side `filters` are merged into the
+        request params, and the rest are applied while parsing. If an `archive`
+        is given the raw response body is appended to it."""
+        key, call = self._prepare(sort_by, filters, archive, kwargs)
+        (response, ads), shared = flight.do(key, call)
+        return self._apply(response, ads, shared)
+
+    async def fetch_async(
+        self,
+        sort_by: Optional[str] = None,
+        filters: Optional[SearchFilters] = None,
+        archive: Optional["Archive"] = None,
+        **kwargs
+    ) -> int:
+        """The same as `fetch()`, awaitable from asyncio."""
+        key, call = self._prepare(sort_by, filters, archive, kwargs)
+        (response, ads), shared = await flight.do_async(key, call)
+        return self._apply(response, ads, shared)
+
+    def shards(self) -> List["Search"]:
+        """One search per sub-area of this search's metro, or an empty list if
+        it has none or this search is already limited to a sub-area. These
+        can also be merged in sort order with `TopKMerge`."""
+        if self.sub_area:
+            return []
+        return [
+            Search(self.query, self.city, self.category, backend=self.backend, sub_area=sub_area)
+            for sub_area in get_sub_areas(self.city)
+        ]
+
+    def fetch_sharded(self, max_workers: int = 8, delay: float = 0.0, **kwargs) -> int:
+        """Fetch a metro search as one search per sub-area, up to
+        `max_workers` at a time, so broad queries are not cut off by the
+        per-search result cap. Each shard after the first waits `delay`
+        seconds before its request; with `max_workers=1` the shards are
+        fetched one after another. The ads are merged in sub-area order with
+        duplicate d_pids dropped.
+
+        Returns 200 if every shard succeeded, otherwise the first failing
+        status; ads from the shards that did succeed are kept either way.
+        Searches without sub-areas are fetched normally. `kwargs` go to
+        `fetch()`.
+        """
+        shards = self.shards()
+        if not shards:
+            return self.fetch(**kwargs)
+
+        def fetch_shard(index: int) -> int:
+            if delay > 0 and index:
+                time.sleep(delay)
+            return shards[index].fetch(**kwargs)
+
+        if max_workers <= 1:
+            statuses = [fetch_shard(index) for index in range(len(shards))]
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                statuses = list(executor.map(fetch_shard, range(len(shards))))
+
+        seen = set()
+        self.ads = []
+        for shard, status in zip(shards, statuses):
+            if status != 200:
+                continue
+            for ad in shard.ads:
+                if ad.d_pid is not None:
+                    if ad.d_pid in seen:
+                        continue
+                    seen.add(ad.d_pid)
+                self.ads.append(ad)
+        self.requests = [shard.request for shard in shards]
+        self.request = self.requests[0]
+        return next((status for status in statuses if status != 200), 200)
+
+    def _prepare(
+        self,
+        sort_by: Optional[str],
+        filters: Optional[SearchFilters],
+        archive: Optional["Archive"],
+        kwargs: Dict,
+    ) -> Tuple[str, Callable[[], Tuple[requests.Response, List[Ad]]]]:
+        """Returns the single-flight key for this fetch and the call that
+        performs it. Concurrent identical searches share one request and
+        parse (see `singleflight.flight`)."""
+        predicate = None
+        if filters is not None:
+            params, predicate = filters.compile(self.category)
+            kwargs["params"] = {**(kwargs.get("params") or {}), **params}
+        backend = type(self.backend).__name__ + str(getattr(self.backend, "base_url", ""))
+        key = request_key(
+            "search",
+            self.url,
+            backend=backend,
+            sort_by=sort_by,
+            filters=filters.to_dict() if filters is not None else None,
+            archive=archive_key(archive),
+            **kwargs
+        )
+
+        def call() -> Tuple[requests.Response, List[Ad]]:
+            return self.backend.fetch(
+                self, sort_by=sort_by, predicate=predicate, archive=archive, **kwargs
+            )
+
+        return key, call
+
+    def _apply(self, response: requests.Response, ads: List[Ad], shared: bool) -> int:
+        self.request = response
+        if response.status_code == 200:
+            # Coalesced callers get their own copies so they can fetch() them.
+            self.ads = [Ad.from_dict(ad.to_dict()) for ad in ads] if shared else ads
+        return response.status_code
 
     def to_dict(self) -> Dict:
         return {
             "query": self.query,
             "city": self.city,
             "category": self.category,
+            "sub_area": self.sub_area,
             "url": self.url,
             "ads": [ad.to_dict() for ad in self.ads],
         }
@@ -47,8 +227,16 @@ def fetch_search(query: str, city: str, category: str = "sss", **kwargs) -> Sear
 
 
 class SearchParser:
-    def __init__(self, content: Union[str, bytes], **kwargs) -> None:
+    def __init__(
+        self,
+        content: Union[str, bytes],
+        predicate: Optional[Predicate] = None,
+        **kwargs
+    ) -> None:
+        """`predicate`, if given, is called with the title and price of each
+        result row and rows it rejects are skipped before an `Ad` is built."""
         self.soup = BeautifulSoup(content, "html.parser", **kwargs)
+        self.predicate = predicate
 
     @property
     def ads(self) -> List[Ad]:
@@ -66,6 +254,9 @@ class SearchParser:
                 title = ad_html.find(class_="title").text
                 price_element = ad_html.find(class_="price")
                 price = format_price(price_element.text) if price_element else None
+                if self.predicate is not None and not self.predicate(title, price):
+                    continue
+
                 d_pid_match = re.search(r"/(\d+)\.html", url)
                 d_pid = int(d_pid_match.group(1)) if d_pid_match else None
 
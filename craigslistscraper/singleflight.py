@@ -0,0 +1,112 @@
+from concurrent.futures import Future
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import asyncio
+import json
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from .metrics import metrics
+
+
+def normalize_url(url: str, params: Any = None) -> str:
+    """`url` with `params` merged into its query string, the query sorted,
+    the scheme and host lowercased and the fragment dropped."""
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if isinstance(params, dict):
+        query.extend((str(k), str(v)) for k, v in params.items() if v is not None)
+    elif params:
+        query.extend((str(k), str(v)) for k, v in params)
+    return urlunsplit((
+        parts.scheme.lower(),
+        parts.netloc.lower(),
+        parts.path,
+        urlencode(sorted(query)),
+        "",
+    ))
+
+
+def request_key(kind: str, url: str, **kwargs: Any) -> str:
+    """A key under which identical fetches are coalesced. Everything passed
+    to `requests.get` except the timeout is part of it."""
+    params = kwargs.pop("params", None)
+    kwargs.pop("timeout", None)
+    extra = json.dumps(kwargs, sort_keys=True, default=repr)
+    return f"{kind}:{normalize_url(url, params)}:{extra}"
+
+
+def archive_key(archive: Any) -> Optional[int]:
+    """The part of a request key for the archive a fetch writes to, so that
+    fetches only coalesce when the body would go to the same archive."""
+    return id(archive) if archive is not None else None
+
+
+class SingleFlight:
+    def __init__(self) -> None:
+        """Makes concurrent calls for the same key share one execution.
+
+        The first caller for a key runs the function; callers that arrive
+        while it is in flight wait for and receive the same result (or
+        exception). This works across threads with `do()` and across asyncio
+        tasks with `do_async()`, and the two share in-flight calls. Set
+        `enabled` to False to turn coalescing off.
+        """
+        self.enabled = True
+        self.calls = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, Future] = {}
+
+    def _join(self, key: Hashable) -> Tuple[Future, bool]:
+        with self._lock:
+            self.calls += 1
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                metrics.incr("singleflight_coalesced")
+                return future, False
+            future = Future()
+            self._in_flight[key] = future
+        metrics.incr("singleflight_executed")
+        return future, True
+
+    def _run(self, key: Hashable, future: Future, fn: Callable[[], Any]) -> None:
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            future.set_exception(e)
+        else:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            future.set_result(result)
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Returns `fn()`'s result and whether it was shared with another
+        caller rather than computed by this one."""
+        if not self.enabled:
+            return fn(), False
+        future, leader = self._join(key)
+        if leader:
+            self._run(key, future, fn)
+        return future.result(), not leader
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Like `do()`, but awaits the result. A blocking `fn` is run in the
+        event loop's default executor."""
+        loop = asyncio.get_running_loop()
+        if not self.enabled:
+            return await loop.run_in_executor(None, fn), False
+        future, leader = self._join(key)
+        if leader:
+            loop.run_in_executor(None, self._run, key, future, fn)
+        return await asyncio.wrap_future(future), not leader
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"calls": self.calls, "coalesced": self.coalesced}
+
+
+# The group shared by `Ad.fetch` and `Search.fetch`.
+flight = SingleFlight()
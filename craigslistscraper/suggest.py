@@ -0,0 +1,200 @@
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+from .utils import get_areas, get_categories, get_vocabulary
+
+WORD_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?", re.IGNORECASE)
+
+_MISSING = object()
+
+
+def damerau_levenshtein(a: str, b: str, max_distance: int) -> int:
+    """Optimal string alignment distance between `a` and `b`. Returns
+    `max_distance + 1` as soon as the distance is known to exceed it."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    prev_prev: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = current[0]
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(prev[j] + 1, current[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], prev_prev[j - 2] + 1)
+            row_min = min(row_min, current[j])
+        if row_min > max_distance:
+            return max_distance + 1
+        prev_prev, prev = prev, current
+    return prev[-1]
+
+
+class QuerySuggester:
+    def __init__(
+        self,
+        max_edit_distance: int = 2,
+        prefix_length: int = 7,
+        min_length: int = 4,
+        cache_size: int = 10_000,
+        learn_threshold: int = 5,
+    ) -> None:
+        """A SymSpell-style spelling suggester for search queries.
+
+        Every dictionary word is indexed under all the strings obtained by
+        deleting up to `max_edit_distance` characters from its first
+        `prefix_length` characters, so a lookup only has to generate the
+        deletes of the input and check a handful of candidates. Results for up
+        to `cache_size` words are cached.
+
+        Words that are known, shorter than `min_length` or contain a digit
+        (model codes like "e46" or "330i") are never corrected, and neither
+        are words with no close match. Besides the indexed dictionary,
+        `add_known()` marks words as valid without making them suggestions,
+        which keeps a large general dictionary cheap to load.
+
+        `add_query()` and `add_titles()` only learn a word the suggester does
+        not know once it has been seen `learn_threshold` times, so one user's
+        typo does not stop it from being corrected for everyone else.
+        """
+        self.max_edit_distance = max_edit_distance
+        self.prefix_length = prefix_length
+        self.min_length = min_length
+        self.cache_size = cache_size
+        self.learn_threshold = learn_threshold
+        self.words: Dict[str, int] = {}
+        self.deletes: Dict[str, List[str]] = {}
+        self.known: Set[str] = set()
+        self.domain: Set[str] = set()
+        self._cache: Dict[str, Optional[str]] = {}
+        self._pending: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_craigslist(
+        cls,
+        queries: Iterable[str] = (),
+        domain_count: int = 1_000_000,
+        **kwargs
+    ) -> "QuerySuggester":
+        """A suggester seeded with the category descriptions, the area names,
+        the vehicle makes, models and brands in data/vocabulary.txt and any
+        past `queries`. These domain words are added with `domain=True`, so
+        at the same edit distance they are suggested ahead of any
+        general-purpose word, whatever its count."""
+        suggester = cls(**kwargs)
+        texts: List[str] = [cat["Description"] for cat in get_categories()]
+        for area in get_areas():
+            texts.extend([area["Hostname"], area["Description"], area["ShortDescription"]])
+            for sub_area in area.get("SubAreas") or []:
+                texts.extend([sub_area["Description"], sub_area["ShortDescription"]])
+        for text in texts:
+            suggester.add_words(tokenize(text), count=domain_count, domain=True)
+        suggester.add_words(get_vocabulary(), count=domain_count, domain=True)
+        for query in queries:
+            suggester.add_query(query)
+        return suggester
+
+    def _edits(self, word: str) -> Set[str]:
+        prefix = word[: self.prefix_length]
+        edits = {prefix}
+        frontier = {prefix}
+        for _ in range(self.max_edit_distance):
+            frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+            edits |= frontier
+        return edits
+
+    def add_word(self, word: str, count: int = 1, domain: bool = False) -> None:
+        """Adds `word` to the dictionary. Among candidates at the same edit
+        distance, `domain` words rank first, then higher counts."""
+        word = word.lower()
+        with self._lock:
+            if domain:
+                self.domain.add(word)
+            if word not in self.words:
+                for delete in self._edits(word):
+                    self.deletes.setdefault(delete, []).append(word)
+            self.words[word] = self.words.get(word, 0) + count
+            self._cache.clear()
+
+    def add_words(self, words: Iterable[str], count: int = 1, domain: bool = False) -> None:
+        for word in words:
+            self.add_word(word, count, domain)
+
+    def add_known(self, words: Iterable[str]) -> None:
+        """Marks `words` as valid so they are never corrected, without
+        indexing them as suggestions."""
+        with self._lock:
+            self.known.update(word.lower() for word in words)
+            self._cache.clear()
+
+    def add_query(self, query: str) -> None:
+        """Learns the words of a query a user actually searched for. Known
+        words gain a count; unknown ones are added once they have been seen
+        `learn_threshold` times."""
+        self._learn(tokenize(query))
+
+    def add_titles(self, titles: Iterable[Optional[str]]) -> None:
+        """Learns the words of ad titles, e.g. the makes and models in
+        vehicle results, in the same way as `add_query()`."""
+        for title in titles:
+            if title:
+                self._learn(set(tokenize(title)))
+
+    def _learn(self, words: Iterable[str]) -> None:
+        for word in words:
+            with self._lock:
+                if word in self.words or word in self.known:
+                    count = 1
+                else:
+                    count = self._pending.get(word, 0) + 1
+                    if count < self.learn_threshold:
+                        self._pending[word] = count
+                        continue
+                    self._pending.pop(word, None)
+            self.add_word(word, count)
+
+    def lookup(self, word: str) -> Optional[str]:
+        """The best correction for `word`, or None if it should be kept."""
+        word = word.lower()
+        correction = self._cache.get(word, _MISSING)
+        if correction is not _MISSING:
+            return correction
+        correction = self._lookup(word)
+        with self._lock:
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[word] = correction
+        return correction
+
+    def _lookup(self, word: str) -> Optional[str]:
+        if (
+            word in self.words
+            or word in self.known
+            or len(word) < self.min_length
+            or any(c.isdigit() for c in word)
+        ):
+            return None
+
+        best: Optional[str] = None
+        best_key = (self.max_edit_distance + 1, 0, 0)
+        checked: Set[str] = set()
+        for delete in self._edits(word):
+            for candidate in self.deletes.get(delete, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                distance = damerau_levenshtein(word, candidate, best_key[0])
+                key = (distance, candidate not in self.domain, -self.words[candidate])
+                if distance <= self.max_edit_distance and key < best_key:
+                    best, best_key = candidate, key
+        return best
+
+    def correct(self, query: str) -> str:
+        """`query` with every correctable word replaced, or unchanged."""
+        return WORD_RE.sub(lambda m: self.lookup(m.group(0)) or m.group(0), query)
+
+
+def tokenize(text: str) -> List[str]:
+    return WORD_RE.findall(text.lower())
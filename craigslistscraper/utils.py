@@ -2,7 +2,10 @@ from urllib.parse import quote
 import json
 import csv
 import os
+import sqlite3
+import threading
 
+from typing import Any
 from typing import List
 from typing import Dict
 
@@ -22,8 +25,15 @@ def format_price(price: str) -> float:
     return float(price.replace("$", "").replace(",", ""))
 
 
-def build_url(query: str, city: str, category: str = "sss", sort_by: str = None) -> str:
-    url = f"https://{city}.craigslist.org/search/{category}?query={quote(query)}"
+def build_url(
+    query: str,
+    city: str,
+    category: str = "sss",
+    sort_by: str = None,
+    sub_area: str = None,
+) -> str:
+    path = f"{sub_area}/{category}" if sub_area else category
+    url = f"https://{city}.craigslist.org/search/{path}?query={quote(query)}"
     if sort_by:
         url += f"&sort={sort_by}"
     return url
@@ -35,9 +45,49 @@ def get_areas() -> List[Dict]:
     return areas
 
 
+def get_sub_areas(city: str) -> List[str]:
+    """The sub-area abbreviations of a metro hostname (e.g. "sfbay" ->
+    ["sfc", "sby", ...]), or an empty list if it has none."""
+    for area in get_areas():
+        if area["Hostname"] == city:
+            return [sub["Abbreviation"] for sub in area.get("SubAreas") or []]
+    return []
+
+
 def get_categories() -> List[Dict]:
     with open(os.path.join(cs_dir, "data/categories.json"), "r") as file:
         categories = json.load(file)
     return categories
 
 
+
+
+def get_vocabulary() -> List[str]:
+    """Vehicle makes, models and brand names from data/vocabulary.txt."""
+    with open(os.path.join(cs_dir, "data/vocabulary.txt"), "r") as file:
+        return [
+            line.strip()
+            for line in file
+            if line.strip() and not line.startswith("#")
+        ]
+
+
+class ThreadLocalSQLite:
+    def __init__(self, path: str, **pragmas: Any) -> None:
+        """One autocommit connection per thread to the SQLite file at `path`,
+        which is put in WAL mode. Connections wait up to 30 seconds for a
+        lock, and any extra `pragmas` (e.g. `mmap_size=...`) are set on each
+        of them."""
+        self.path = path
+        self.pragmas = pragmas
+        self._local = threading.local()
+        self.connect().execute("PRAGMA journal_mode=WAL")
+
+    def connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            for name, value in self.pragmas.items():
+                conn.execute(f"PRAGMA {name}={value}")
+            self._local.conn = conn
+        return conn
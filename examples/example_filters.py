@@ -9,16 +9,17 @@ search = cs.Search(
     category = "cto"
 )
 
-# Define the filters
-filters = {
-    "postedToday": 0,
-    "bundleDuplicates": 1,
-    "max_price": 5000
-}
-
-# Fetch the html from the server. Don't forget to check the status. Notice that
-# the filters are passed in through the requests.get(params = ...) argument.
-status = search.fetch(params = filters)
+# Define the filters. Misspelled filter names raise an error instead of being
+# silently ignored. Filters that Craigslist supports for the category are sent
+# to the server, the rest (like `exclude_words`) are applied while parsing.
+filters = cs.SearchFilters(
+    bundle_duplicates = True,
+    max_price = 5000,
+    exclude_words = ["parts", "parting"]
+)
+
+# Fetch the html from the server. Don't forget to check the status.
+status = search.fetch(filters = filters)
 if status != 200:
     raise Exception(f"Unable to fetch search with status <{status}>.")
 
@@ -0,0 +1,55 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import threading
+
+import pytest
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Passes each GET to the server's `handle_get(request)` callback."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        try:
+            self.server.handle_get(self)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client stopped reading early.
+        self.close_connection = True
+
+    def respond(self, status, body, content_type="text/html; charset=utf-8", chunked=False):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for start in range(0, len(body), 4096):
+                chunk = body[start:start + 4096]
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    """A factory for local HTTP servers: `http_server(handle_get)` starts one
+    that calls `handle_get(request)` for every GET and returns its base url.
+    Servers are shut down after the test."""
+    servers = []
+
+    def start(handle_get):
+        server = HTTPServer(("127.0.0.1", 0), StubHandler)
+        server.handle_get = handle_get
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,58 @@
+import pytest
+
+from craigslistscraper import Ad, metrics
+
+HEAD = (
+    b'<html><head><meta property="og:url" '
+    b'content="https://sfbay.craigslist.org/sby/cto/d/sedan/7790000100.html"></head><body>'
+    b'<span class="postingtitletext"><span class="price">$8,500</span>'
+    b'<span id="titletextonly">2008 BMW 328i sedan</span></span>'
+    b'<p class="attrgroup"><span>odometer: <b>98000</b></span></p>'
+    b'<section id="postingbody">Runs great.</section>'
+)
+# Related postings, footer and scripts that the parser never looks at.
+TAIL = b"<div class='related'>" + b"<p>filler</p>" * 20000 + b"</div></body></html>"
+PAGE = HEAD + TAIL
+
+
+@pytest.fixture
+def server(http_server):
+    def handle_get(request):
+        request.respond(200, PAGE, chunked=request.path.startswith("/chunked"))
+
+    return http_server(handle_get)
+
+
+def test_stream_stops_after_posting_body(server):
+    metrics.reset()
+    ad = Ad(url=server + "/ad/7790000100.html")
+
+    assert ad.fetch(stream=True, chunk_size=1024) == 200
+    assert ad.title == "2008 BMW 328i sedan"
+    assert ad.price == 8500.0
+    assert ad.description == "Runs great."
+    assert ad.attributes == {"odometer": "98000"}
+    assert ad.bytes_read < len(PAGE) // 2
+    assert ad.bytes_saved == len(PAGE) - ad.bytes_read
+    assert metrics.get("ad_stream_early_stops") == 1
+    assert metrics.get("ad_bytes_saved") == ad.bytes_saved
+
+
+def test_stream_matches_full_fetch(server):
+    streamed = Ad(url=server + "/ad/7790000100.html")
+    full = Ad(url=server + "/ad/7790000100.html")
+
+    assert streamed.fetch(stream=True) == 200
+    assert full.fetch() == 200
+    assert streamed.to_dict() == full.to_dict()
+
+
+def test_chunked_stream_has_unknown_savings(server):
+    metrics.reset()
+    ad = Ad(url=server + "/chunked/7790000100.html")
+
+    assert ad.fetch(stream=True, chunk_size=1024) == 200
+    assert ad.title == "2008 BMW 328i sedan"
+    assert ad.bytes_read < len(PAGE) // 2
+    assert ad.bytes_saved is None
+    assert metrics.get("ad_bytes_saved_unknown") == 1
@@ -0,0 +1,82 @@
+import pytest
+
+import craigslistscraper.cache as cache_module
+from craigslistscraper import ResultCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    return clock
+
+
+def test_values_round_trip(tmp_path, clock):
+    cache = ResultCache(str(tmp_path / "results.sqlite"))
+    cache.set("key", [{"url": "u", "price": 1.0}])
+
+    assert cache.get("key") == [{"url": "u", "price": 1.0}]
+    assert cache.get("missing") is None
+
+
+def test_entries_expire_after_ttl(tmp_path, clock):
+    cache = ResultCache(str(tmp_path / "results.sqlite"), ttl=60)
+    cache.set("default", 1)
+    cache.set("longer", 2, ttl=600)
+
+    clock.now += 61
+    assert cache.get("default") is None
+    assert cache.get("longer") == 2
+
+
+def test_get_or_set_computes_once(tmp_path, clock):
+    cache = ResultCache(str(tmp_path / "results.sqlite"))
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return "value"
+
+    assert cache.get_or_set("key", compute) == "value"
+    assert cache.get_or_set("key", compute) == "value"
+    assert len(calls) == 1
+    assert cache.get_or_set("none", lambda: None) is None
+    assert cache.get("none") is None
+
+
+def test_eviction_drops_least_recently_read(tmp_path, clock):
+    cache = ResultCache(str(tmp_path / "results.sqlite"), ttl=1000, max_bytes=1000, check_every=1)
+    for i in range(4):
+        cache.set(f"k{i}", "x" * 200)
+        clock.now += 200
+    # Reading k0 long after it was written moves it to the back of the LRU.
+    assert cache.get("k0") is not None
+    clock.now += 1
+
+    cache.set("k4", "x" * 200)
+
+    assert cache.size() <= 900
+    assert cache.get("k0") is not None
+    assert cache.get("k1") is None
+    assert cache.get("k4") is not None
+
+
+def test_eviction_drops_expired_entries_first(tmp_path, clock):
+    cache = ResultCache(str(tmp_path / "results.sqlite"), ttl=1000, max_bytes=800, check_every=1)
+    cache.set("short", "x" * 300, ttl=10)
+    cache.set("long", "x" * 300)
+    clock.now += 20
+
+    cache.set("new", "x" * 300)
+
+    assert cache.get("long") is not None
+    assert cache.get("new") is not None
+    assert cache.size() == 2 * len('"' + "x" * 300 + '"')
@@ -0,0 +1,98 @@
+import pytest
+
+from craigslistscraper import Ad, DeltaFetcher, FingerprintStore
+
+PAGE = (
+    '<meta property="og:url" content="https://sfbay.craigslist.org/sby/cto/d/x/{d_pid}.html">'
+    '<span class="price">${price}</span><span id="titletextonly">{title}</span>'
+    '<section id="postingbody">Body of {d_pid}.</section>'
+)
+
+
+@pytest.fixture
+def site(http_server):
+    """A local server for ad pages; `site["pages"][d_pid]` is (title, price)
+    and `site["hits"]` counts requests per d_pid."""
+    state = {"pages": {}, "hits": {}}
+
+    def handle_get(request):
+        d_pid = int(request.path.rsplit("/", 1)[-1].split(".")[0])
+        state["hits"][d_pid] = state["hits"].get(d_pid, 0) + 1
+        if d_pid not in state["pages"]:
+            request.respond(404, b"gone")
+            return
+        title, price = state["pages"][d_pid]
+        request.respond(200, PAGE.format(d_pid=d_pid, title=title, price=price).encode())
+
+    state["url"] = http_server(handle_get)
+    return state
+
+
+def rows(site):
+    """The search rows for every page on the site, as a results page would
+    list them."""
+    ads = []
+    for d_pid, (title, price) in sorted(site["pages"].items()):
+        ads.append(Ad(url=f"{site['url']}/ad/{d_pid}.html", title=title, price=float(price), d_pid=d_pid))
+    return ads
+
+
+@pytest.fixture
+def fetcher(tmp_path):
+    return DeltaFetcher(FingerprintStore(str(tmp_path / "delta.sqlite")))
+
+
+def test_first_run_fetches_everything(site, fetcher):
+    site["pages"] = {1: ("bmw", 100), 2: ("audi", 200)}
+
+    result = fetcher.fetch(rows(site))
+
+    assert [ad.d_pid for ad in result["fetched"]] == [1, 2]
+    assert result["skipped"] == []
+    assert site["hits"] == {1: 1, 2: 1}
+
+
+def test_unchanged_rows_are_skipped_and_hydrated(site, fetcher):
+    site["pages"] = {1: ("bmw", 100), 2: ("audi", 200)}
+    fetcher.fetch(rows(site))
+
+    result = fetcher.fetch(rows(site))
+
+    assert result["fetched"] == []
+    assert [ad.d_pid for ad in result["skipped"]] == [1, 2]
+    assert result["skipped"][0].description == "Body of 1."
+    assert site["hits"] == {1: 1, 2: 1}
+
+
+def test_changed_row_is_fetched_again(site, fetcher):
+    site["pages"] = {1: ("bmw", 100), 2: ("audi", 200)}
+    fetcher.fetch(rows(site))
+    site["pages"][2] = ("audi", 150)
+
+    result = fetcher.fetch(rows(site))
+
+    assert [ad.d_pid for ad in result["fetched"]] == [2]
+    assert result["fetched"][0].price == 150.0
+    assert [ad.d_pid for ad in result["skipped"]] == [1]
+
+
+def test_failed_fetch_is_retried_next_time(site, fetcher):
+    site["pages"] = {1: ("bmw", 100)}
+    ads = rows(site)
+    del site["pages"][1]
+
+    assert [ad.d_pid for ad in fetcher.fetch(ads)["failed"]] == [1]
+    site["pages"] = {1: ("bmw", 100)}
+    assert [ad.d_pid for ad in fetcher.fetch(rows(site))["fetched"]] == [1]
+
+
+def test_stale_ads_are_reverified(site, tmp_path):
+    fetcher = DeltaFetcher(
+        FingerprintStore(str(tmp_path / "delta.sqlite")), reverify_after=60, reverify_limit=1
+    )
+    site["pages"] = {1: ("bmw", 100), 2: ("audi", 200)}
+    fetcher.fetch(rows(site))
+
+    assert fetcher.select(rows(site)) == []
+    stale = fetcher.select(rows(site), now=10 ** 12)
+    assert len(stale) == 1
@@ -0,0 +1,121 @@
+import os
+
+import pytest
+
+from craigslistscraper import JSONSearchBackend, Search, SearchFilters, SearchJSONParser
+from craigslistscraper.search import SearchBackend
+
+# A hand-written response in the shape of the sapi search endpoint (compact
+# posting arrays plus a decode block), not a recording of a live response.
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "sapi_search_synthetic.json")
+
+
+@pytest.fixture
+def synthetic():
+    with open(FIXTURE, "rb") as file:
+        return file.read()
+
+
+@pytest.fixture
+def stub(synthetic, http_server):
+    """A local server that replays `state["body"]` with `state["status"]`
+    and records the request paths."""
+    state = {"status": 200, "body": synthetic, "paths": []}
+
+    def handle_get(request):
+        state["paths"].append(request.path)
+        request.respond(state["status"], state["body"], content_type="application/json")
+
+    state["url"] = http_server(handle_get) + "/postings/search/full"
+    return state
+
+
+class RecordingBackend(SearchBackend):
+    def __init__(self):
+        self.calls = 0
+
+    def fetch(self, search, sort_by=None, predicate=None, archive=None, **kwargs):
+        self.calls += 1
+
+        class Response:
+            status_code = 200
+
+        return Response(), []
+
+
+def test_parser_decodes_response(synthetic):
+    parser = SearchJSONParser(synthetic, hostname="sfbay")
+    ads = parser.ads
+
+    assert parser.total == 4
+    assert [ad.d_pid for ad in ads] == [7790000100, 7790000200, 7790000250, 7790000300]
+    first = ads[0]
+    assert first.title == "2008 BMW 328i sedan"
+    assert first.price == 8500.0
+    assert first.url == "https://sfbay.craigslist.org/sby/cto/d/2008-bmw-328i-sedan/7790000100.html"
+    assert first.image_urls == [
+        "https://images.craigslist.org/00A0A_abc123_600x450.jpg",
+        "https://images.craigslist.org/00B0B_def456_600x450.jpg",
+    ]
+    assert ads[1].url.startswith("https://sfbay.craigslist.org/eby/cto/")
+    # A negative price means none was given.
+    assert ads[3].price is None
+
+
+def test_parser_columns(synthetic):
+    columns = SearchJSONParser(synthetic, hostname="sfbay").columns
+
+    assert columns["d_pid"] == [7790000100, 7790000200, 7790000250, 7790000300]
+    assert columns["posted"][0] == 1729205000
+    assert columns["latitude"][:2] == [37.3382, 37.8044]
+    assert columns["longitude"][3] is None
+
+
+def test_backend_fetches_from_stub(stub):
+    search = Search("bmw", "sfbay", "cto", backend=JSONSearchBackend(fallback=False, base_url=stub["url"]))
+
+    assert search.fetch() == 200
+    assert len(search.ads) == 4
+    assert "batch=1-0-360-0-0" in stub["paths"][0]
+    assert "searchPath=cto" in stub["paths"][0]
+
+
+def test_backend_applies_predicate(stub):
+    backend = JSONSearchBackend(fallback=False, base_url=stub["url"])
+    search = Search("bmw", "sfbay", "cto", backend=backend)
+    filters = SearchFilters(exclude_words=["parts"], require_price=True)
+
+    assert search.fetch(filters=filters) == 200
+    assert [ad.title for ad in search.ads] == ["2008 BMW 328i sedan", "2012 Honda Civic EX"]
+
+
+@pytest.mark.parametrize("status, body", [(500, b"{}"), (200, b"<html>not json</html>")])
+def test_backend_falls_back_to_html(stub, status, body):
+    stub["status"], stub["body"] = status, body
+    fallback = RecordingBackend()
+    search = Search("civic", "sfbay", "cto", backend=JSONSearchBackend(fallback=fallback, base_url=stub["url"]))
+
+    assert search.fetch() == 200
+    assert fallback.calls == 1
+
+
+def test_reparse_archived_json_response(stub, tmp_path):
+    from craigslistscraper import Archive, reparse
+
+    backend = JSONSearchBackend(fallback=False, base_url=stub["url"])
+    with Archive(str(tmp_path), compression="zlib") as archive:
+        assert Search("bmw", "sfbay", "cto", backend=backend).fetch(archive=archive) == 200
+
+    records = reparse(str(tmp_path), kind="search_json", compression="zlib")
+
+    assert len(records) == 1
+    assert records[0]["total"] == 4
+    assert records[0]["columns"]["d_pid"][0] == 7790000100
+
+
+def test_backend_moves_the_page_offset_into_batch(stub):
+    backend = JSONSearchBackend(fallback=False, base_url=stub["url"])
+
+    assert Search("bmw", "sfbay", "cto", backend=backend).fetch(params={"s": 360}) == 200
+    assert "batch=1-360-360-0-0" in stub["paths"][0]
+    assert "&s=" not in stub["paths"][0]
@@ -0,0 +1,103 @@
+import pytest
+
+from craigslistscraper import Ad, Search, SearchFilters, TopKMerge, top_k
+from craigslistscraper.search import SearchBackend
+
+
+class Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class PagedBackend(SearchBackend):
+    """Serves `rows` (already in server sort order) `page_size` at a time,
+    selected by the `s` offset param."""
+
+    def __init__(self, rows, page_size=3, status_code=200):
+        self.rows = rows
+        self.page_size = page_size
+        self.status_code = status_code
+        self.requests = 0
+
+    def fetch(self, search, sort_by=None, predicate=None, archive=None, **kwargs):
+        self.requests += 1
+        start = (kwargs.get("params") or {}).get("s", 0)
+        ads = [
+            Ad(url=f"https://{search.city}.craigslist.org/cto/d/x/{d_pid}.html", d_pid=d_pid, title=title, price=price)
+            for d_pid, title, price in self.rows[start:start + self.page_size]
+        ]
+        if predicate is not None:
+            ads = [ad for ad in ads if predicate(ad.title, ad.price)]
+        return Response(self.status_code), ads
+
+
+def search(backend, city="sfbay"):
+    return Search("bmw", city, "cto", backend=backend)
+
+
+def test_merges_in_price_order_across_cities():
+    a = PagedBackend([(1, "car", 100), (2, "car", 300), (3, "car", 500), (4, "car", 700)])
+    b = PagedBackend([(5, "car", 200), (6, "car", 400), (7, "car", 600)])
+
+    ads = top_k([search(a), search(b, "boise")], 4, page_size=3)
+
+    assert [ad.price for ad in ads] == [100, 200, 300, 400]
+
+
+def test_stops_fetching_once_k_ads_are_out():
+    rows = [(i, "car", i) for i in range(1, 31)]
+    backend = PagedBackend(rows)
+    merge = TopKMerge([search(backend)], 4, page_size=3)
+
+    assert [ad.d_pid for ad in merge] == [1, 2, 3, 4]
+    assert merge.pages_fetched == 2
+
+
+def test_short_filtered_page_is_not_the_last():
+    rows = [(i, "parts" if i % 2 else "car", i) for i in range(1, 10)]
+    backend = PagedBackend(rows)
+
+    ads = top_k([search(backend)], 4, page_size=3, filters=SearchFilters(exclude_words=["parts"]))
+
+    assert [ad.d_pid for ad in ads] == [2, 4, 6, 8]
+
+
+def test_page_emptied_by_filters_keeps_cursor_going():
+    rows = [(1, "parts lot", 1), (2, "parts lot", 2), (3, "parts lot", 3),
+            (4, "car", 4), (5, "car", 5), (6, "car", 6)]
+    backend = PagedBackend(rows)
+
+    ads = top_k([search(backend)], 2, page_size=3, filters=SearchFilters(exclude_words=["parts"]))
+
+    assert [ad.d_pid for ad in ads] == [4, 5]
+
+
+def test_failed_page_raises():
+    backend = PagedBackend([(1, "car", 1)], status_code=500)
+
+    with pytest.raises(RuntimeError):
+        top_k([search(backend)], 2, page_size=3)
+
+
+def test_backend_that_ignores_the_offset_is_not_paged_forever():
+    class SamePage(PagedBackend):
+        def fetch(self, search, sort_by=None, predicate=None, archive=None, **kwargs):
+            kwargs["params"] = {}
+            return super().fetch(search, sort_by, predicate, archive, **kwargs)
+
+    backend = SamePage([(1, "car", 1), (2, "car", 2), (3, "car", 3)])
+
+    ads = top_k([search(backend)], 10, page_size=3)
+
+    assert [ad.d_pid for ad in ads] == [1, 2, 3]
+    assert backend.requests == 2
+
+
+def test_page_size_defaults_to_the_backends():
+    backend = PagedBackend([(i, "car", i) for i in range(1, 6)], page_size=5)
+    backend_search = search(backend)
+
+    merge = TopKMerge([backend_search], 3)
+
+    assert [ad.d_pid for ad in merge] == [1, 2, 3]
+    assert merge.cursors[0].page_size == 5